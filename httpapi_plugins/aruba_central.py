@@ -25,14 +25,112 @@ Ansible httpapi plugin to connect with Aruba Central
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
+import gzip
+import hashlib
+import io
 import json
+import os
+import tempfile
+import threading
+import time
+import uuid
 import requests
-from ansible.module_utils._text import to_text
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from ansible.plugins.httpapi import HttpApiBase
 from ansible.utils.display import Display
 display = Display()
 from ansible.errors import AnsibleError
 
+try:
+    from requests_toolbelt import MultipartEncoder
+    HAS_TOOLBELT = True
+except ImportError:
+    HAS_TOOLBELT = False
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    # The same decoder CentralApi uses, when the role's module_utils are
+    # importable on the controller
+    from ansible.module_utils.central_http import load_json
+except ImportError:
+    def load_json(raw):
+        '''
+        Decodes a JSON response body, using orjson when it is available
+        '''
+        if HAS_ORJSON:
+            return orjson.loads(raw)
+        return json.loads(raw)
+
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
+# Raised for malformed or truncated JSON bodies. ijson's errors are not
+# ValueErrors.
+_JSON_ERRORS = (ValueError, ijson.JSONError) if HAS_IJSON else (ValueError,)
+
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+# Connection pool and retry policy for the requests session. Central
+# answers 429 when its rate limit is hit; idempotent requests are retried
+# with backoff on that and on gateway errors, honouring Retry-After.
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = 64
+RETRY_POLICY = dict(total=3, backoff_factor=0.3,
+                    status_forcelist=(429, 502, 503, 504),
+                    raise_on_status=False)
+# Upper bound on the requests of a send_requests() batch in flight at once
+FANOUT_WORKERS = 8
+# Same bound for the asyncio implementations of send_requests(), which
+# also apply RETRY_POLICY themselves. Throttled (429) requests are retried
+# whatever their method, gateway errors only for idempotent methods.
+ASYNC_IN_FLIGHT = POOL_MAXSIZE
+_IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "PUT", "DELETE", "OPTIONS"))
+# Responses to GET requests made with a cache_ttl are kept for reuse by
+# later tasks on this persistent connection, until any other request is
+# sent. Cache-Control max-age or Expires on the response, when present,
+# can only shorten that lifetime, never extend it. Expired entries with an
+# ETag are revalidated with If-None-Match rather than fetched again;
+# responses to other GETs are kept for that revalidation only. Bounded so
+# a long play cannot grow it indefinitely.
+RESPONSE_CACHE_SIZE = 256
+# Read size used when collecting streamed multipart/form-data downloads
+STREAM_CHUNK_SIZE = 65536
+# Request bodies smaller than this are sent uncompressed even when
+# compress_requests is on, gzip would not make them noticeably smaller
+GZIP_MIN_SIZE = 1024
+# JSON bodies larger than this are parsed straight off the socket with ijson
+# instead of being buffered first
+STREAM_JSON_THRESHOLD = 256 * 1024
+
+# Multipart field name expected by Central and the content type of the
+# uploaded part, keyed by the last segment of the upload endpoint
+_UPLOAD_FIELD_BY_SEGMENT = {
+    "template_variables": ("variables", "application/json"),
+    "templates": ("template", "text/plain"),
+}
+
 DOCUMENTATION = """
 ---
 author: Aruba Networks
@@ -57,6 +155,52 @@ options:
       - Autogenerated only with the inventory plugin
     vars:
       - name: ansible_httpapi_central_inv_plugin
+  use_http2:
+    type: bool
+    default: false
+    description:
+      - Multiplex requests made by this plugin over a single HTTP/2
+        connection when httpx is installed with HTTP/2 support
+      - Falls back to requests over HTTP/1.1 otherwise
+    vars:
+      - name: ansible_httpapi_central_use_http2
+  compress_requests:
+    type: bool
+    default: false
+    description:
+      - Gzip request bodies larger than 1 KiB and send them with
+        "Content-Encoding: gzip", which saves bandwidth on large JSON
+        payloads such as device variables
+      - File uploads are always sent uncompressed
+    vars:
+      - name: ansible_httpapi_central_compress_requests
+  etag_cache_dir:
+    type: path
+    description:
+      - Directory in which cached template, variable and other read
+        responses are kept along with their ETag, so that later playbook
+        runs revalidate them with If-None-Match instead of downloading
+        them again
+      - Responses Central marks as fresh with Cache-Control max-age or
+        Expires are served from this directory without a request until
+        they expire, or the cache time the module asked for runs out if
+        that is sooner
+      - The directory is created with owner-only permissions. Leave unset
+        to only cache responses in memory for the life of the connection
+      - Entries are kept apart per client_id, or per access token when no
+        client_id is set, and dropped whenever a change is sent
+    vars:
+      - name: ansible_httpapi_central_etag_cache_dir
+  client_id:
+    type: str
+    description:
+      - Client ID of the Central API client the access token belongs to.
+        Identifies the Central account whose responses are stored in
+        etag_cache_dir, so that accounts sharing an API gateway never see
+        each other's cached responses
+      - Set automatically by the inventory plugin
+    vars:
+      - name: ansible_httpapi_central_client_id
 
     
 """
@@ -66,18 +210,77 @@ class HttpApi(HttpApiBase):
         super(HttpApi, self).__init__(*args, **kwargs)
         self.retry = 0
         self.access_token = None
+        self._auth_header_value = None
         self.url = None
+        self._http2_client = None
+        self._response_cache = {}
+        # send_requests() and send_files() may call send_request() from
+        # several threads, which share the response cache and HTTP/2 client
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        self._session.mount("https://", HTTPAdapter(
+            pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+            max_retries=Retry(**RETRY_POLICY)))
+
+    def set_access_token(self, access_token):
+        if access_token != self.access_token:
+            self.access_token = access_token
+            self._auth_header_value = None
+            if access_token is not None:
+                self._auth_header_value = "Bearer " + access_token
+            # Attach the header once, the clients send their default headers
+            # with each request
+            self._session.headers.pop("Authorization", None)
+            if self._http2_client:
+                self._http2_client.headers.pop("Authorization", None)
+            if self._auth_header_value is not None:
+                auth = {"Authorization": self._auth_header_value}
+                self._session.headers.update(auth)
+                if self._http2_client:
+                    self._http2_client.headers.update(auth)
+
+    def http2_client(self):
+        '''
+        Returns the shared HTTP/2 client, or None when use_http2 is off or
+        httpx/h2 are not installed
+        '''
+        if (self._http2_client is None and HAS_HTTPX and
+                self.get_option("use_http2")):
+            with self._lock:
+                if self._http2_client is None:
+                    self._http2_client = self._new_http2_client()
+        return self._http2_client or None
+
+    def _new_http2_client(self):
+        try:
+            return httpx.Client(
+                http2=True,
+                headers=self._session.headers,
+                verify=self.connection.get_option('validate_certs'),
+                limits=httpx.Limits(
+                    max_connections=POOL_MAXSIZE,
+                    max_keepalive_connections=POOL_CONNECTIONS))
+        except ImportError:
+            # http2=True needs the optional h2 package
+            return False
 
     def valid_token(self):
         if self.get_option("central_inventory_plugin"):
-            self.access_token  = self.get_option("access_token")
+            self.set_access_token(self.get_option("access_token"))
 
         elif self.get_option("access_token") is not None:
+            if self.get_option("access_token") == self.access_token:
+                # Already validated earlier on this persistent connection
+                return
             headers = {'Authorization': "Bearer " + self.get_option("access_token") }
             path = "/configuration/v2/groups?limit=1&offset=0"
-            response, response_data = self.connection.send(path=path, method="GET", headers=headers, data={})
-            if response.code == 200 and response_data != None:
-                self.access_token  = self.get_option("access_token")
+            response = self._session.get(
+                self.build_url(path), headers=headers,
+                verify=self.connection.get_option('validate_certs'),
+                timeout=self.connection.get_option('persistent_command_timeout'))
+            if response.status_code == 200 and response.content:
+                self.set_access_token(self.get_option("access_token"))
         else:
             raise AnsibleError("Access token is either invalid or not present in the inventory file! "
                 "Use ansible_httpapi_central_access_token variable in the basic inventory file with "
@@ -86,52 +289,616 @@ class HttpApi(HttpApiBase):
 
     def send_request(self, data, headers, **message_kwargs):
         self.valid_token()
-        headers['Authorization'] = "Bearer " + self.access_token
         path = message_kwargs['path']
         method = message_kwargs['method']
+        stream_items_path = message_kwargs.get('stream_items_path')
+        cache_ttl = message_kwargs.get('cache_ttl')
+        cache_key = None
+        if method.upper() != "GET":
+            # Anything but a GET may change what a cached read returns
+            self.invalidate_cache()
+        else:
+            cache_key = (self.access_token, path, headers.get('Accept'),
+                         headers.get('Content-Type'), stream_items_path)
+            cache_file = None
+            if cache_ttl:
+                cache_file = self.etag_cache_file(path, headers,
+                                                  stream_items_path)
+            with self._lock:
+                cached = self._response_cache.get(cache_key)
+            if cached is None and cache_file is not None:
+                cached = read_etag_cache(cache_file)
+            if cached is not None:
+                expires, cached_result, etag = cached
+                if expires > time.monotonic():
+                    return cached_result
+                if etag:
+                    headers = dict(headers)
+                    headers['If-None-Match'] = etag
+
+        # Sent on the plugin's own pooled session rather than through
+        # connection.send(), so that every task run over this persistent
+        # connection reuses the same keep-alive TLS connections. requests
+        # also inflates gzip encoded bodies by itself.
+        data, headers = self.compress_body(data, headers)
+        multipart = headers.get("Accept") == "multipart/form-data"
+        timeout = self.connection.get_option('persistent_command_timeout')
+        http2_client = self.http2_client()
+        if http2_client is not None:
+            # Concurrent requests, e.g. from send_requests(), share one
+            # multiplexed HTTP/2 connection
+            response = http2_client.request(
+                method, self.build_url(path), content=data or None,
+                headers=headers, timeout=timeout)
+            content = response.content
+        else:
+            response = self._session.request(
+                method, self.build_url(path), data=data or None,
+                headers=headers,
+                verify=self.connection.get_option('validate_certs'),
+                timeout=timeout, stream=True)
+            content = None
+            if multipart:
+                # Configuration downloads can be large, collect them into a
+                # single buffer instead of a list of chunks joined at the end
+                content = bytearray()
+                for chunk in response.iter_content(
+                        chunk_size=STREAM_CHUNK_SIZE):
+                    content += chunk
+            elif not is_large_json(response):
+                content = response.content
+        if content is None:
+            try:
+                response_data = stream_json(response, stream_items_path)
+            except _JSON_ERRORS as err:
+                # Part of the body is already consumed, e.g. the connection
+                # dropped halfway, so report a bad gateway reply
+                return ("Invalid JSON response from Aruba Central: "
+                        "{}".format(err)), 502
+        else:
+            response_data = self.decode_response(
+                headers, content, response.headers.get('Content-Type'),
+                stream_items_path)
+        result = self.handle_response(response, response_data)
+        if cache_key is None or \
+                'no-store' in (response.headers.get('Cache-Control') or
+                               '').lower():
+            return result
+        new_etag = response.headers.get('ETag')
+        # Only reads a module asked to cache may be served without a
+        # request, and never for longer than the module asked for
+        lifetime = freshness_lifetime(response.headers) if cache_ttl else None
+        ttl = cache_ttl or 0
+        if lifetime is not None:
+            ttl = min(ttl, lifetime)
+        if response.status_code == 304 and cached is not None:
+            # Unchanged since it was cached, keep serving the stored body
+            result = cached_result
+            new_etag = new_etag or etag
+        elif not 200 <= response.status_code < 300 or \
+                not (ttl or new_etag):
+            return result
+        # Kept fresh across runs only as long as Central itself allows
+        disk_ttl = ttl if lifetime else 0
+        if (new_etag or disk_ttl) and cache_file is not None:
+            write_etag_cache(cache_file, new_etag, result, disk_ttl)
+        with self._lock:
+            if (cache_key not in self._response_cache and
+                    len(self._response_cache) >= RESPONSE_CACHE_SIZE):
+                self._response_cache.pop(next(iter(self._response_cache)))
+            self._response_cache[cache_key] = (time.monotonic() + ttl,
+                                               result, new_etag)
+        return result
+
+    def etag_cache_account_dir(self):
+        '''
+        Returns the directory under etag_cache_dir holding the cached
+        responses of this Central account, or None when no etag_cache_dir is
+        set
+        '''
+        cache_dir = self.get_option("etag_cache_dir")
+        if not cache_dir:
+            return None
+        # The client ID outlives token renewals; without it entries are only
+        # shared by callers of the same access token
+        account = self.get_option("client_id") or self.access_token or ""
+        key = json.dumps([self.connection.get_option('host'), account])
+        return os.path.join(os.path.expanduser(cache_dir),
+                            hashlib.sha256(key.encode()).hexdigest())
+
+    def etag_cache_file(self, path, headers, stream_items_path):
+        '''
+        Returns the file under etag_cache_dir holding the cached response to
+        a read, or None when no etag_cache_dir is set
+        '''
+        account_dir = self.etag_cache_account_dir()
+        if account_dir is None:
+            return None
+        key = json.dumps([path, headers.get('Accept'),
+                          headers.get('Content-Type'), stream_items_path])
+        return os.path.join(account_dir,
+                            hashlib.sha256(key.encode()).hexdigest() +
+                            ".json")
 
-        response, response_data = self.connection.send(data=data,
-                                                       headers=headers,
-                                                       path=path,
-                                                       method=method)
+    def invalidate_cache(self):
+        '''
+        Drops every cached response of this account, in memory and under
+        etag_cache_dir, after a request that may have changed them
+        '''
+        with self._lock:
+            self._response_cache.clear()
+        account_dir = self.etag_cache_account_dir()
+        if account_dir is None:
+            return
+        try:
+            with os.scandir(account_dir) as entries:
+                cache_files = [entry.path for entry in entries
+                               if entry.name.endswith(".json")]
+        except OSError:
+            return
+        for cache_file in cache_files:
+            try:
+                os.remove(cache_file)
+            except OSError:
+                # Already removed by a concurrent upload
+                pass
+
+    def compress_body(self, data, headers):
+        '''
+        Gzips a large request body when compress_requests is on. Returns the
+        body to send and its request headers.
+        '''
+        if (not data or len(data) <= GZIP_MIN_SIZE or
+                not self.get_option("compress_requests")):
+            return data, headers
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        headers = dict(headers)
+        headers["Content-Encoding"] = "gzip"
+        return gzip.compress(data, compresslevel=3), headers
+
+    def decode_response(self, headers, content, content_type=None,
+                        stream_items_path=None):
+        '''
+        Decodes a response body according to the headers of its request and
+        the Content-Type of the response, so that JSON reaches the modules
+        already parsed
+        '''
+        response_data = io.BytesIO(content)
+        is_json = "json" in (content_type or "") or \
+            headers.get("Content-Type") == "application/json"
         try:
             if "Accept" in headers and headers["Accept"] == "multipart/form-data":
-                response_data = to_text(response_data.read())
-            elif "Content-Type" in headers and headers["Content-Type"] == "application/json":
-                response_data = json.loads(to_text(response_data.read()))
+                response_data = response_data.read().decode("utf-8")
+            elif is_json:
+                if stream_items_path:
+                    response_data = load_items(response_data,
+                                               stream_items_path)
+                else:
+                    response_data = load_json(response_data.read())
             else:
                 response_data = response_data.read()
 
-        except ValueError:
+        except _JSON_ERRORS:
+            response_data.seek(0)
             response_data = response_data.read()
-        except AttributeError as arr:
-            raise str(response) + str(arr)
 
-        return self.handle_response(response, response_data)
+        return response_data
 
-    def send_file(self, path, method, filename):
+    def send_requests(self, requests_list, headers):
+        '''
+        Sends a batch of requests concurrently over the pooled session.
+        Each entry of requests_list is a dict with "path", "method" and
+        optionally "data". Returns a list of (response_data, code) in the
+        same order.
+        '''
         self.valid_token()
+        if any(request['method'].upper() != "GET"
+               for request in requests_list):
+            # send_request() does this per request, but the asyncio paths
+            # below do not go through it
+            self.invalidate_cache()
+        coroutine = None
+        if self.http2_client() is not None:
+            # One HTTP/2 connection multiplexes the whole batch
+            coroutine = self.send_requests_http2(requests_list, headers)
+        elif HAS_AIOHTTP:
+            coroutine = self.send_requests_async(requests_list, headers)
+        if coroutine is not None:
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(coroutine)
+            finally:
+                loop.close()
+
+        def send(request):
+            return self.send_request(data=request.get('data'),
+                                     headers=dict(headers),
+                                     path=request['path'],
+                                     method=request['method'])
+
+        workers = min(FANOUT_WORKERS, len(requests_list)) or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(send, requests_list))
+
+    async def send_requests_http2(self, requests_list, headers):
+        '''
+        httpx implementation of send_requests(), sending every request of
+        the batch as a separate stream of one HTTP/2 connection
+        '''
+        timeout = self.connection.get_option('persistent_command_timeout')
+        async with httpx.AsyncClient(
+                http2=True, headers=self._session.headers,
+                verify=self.connection.get_option('validate_certs'),
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=POOL_MAXSIZE,
+                    max_keepalive_connections=POOL_CONNECTIONS)) as client:
+
+            semaphore = asyncio.Semaphore(ASYNC_IN_FLIGHT)
+
+            async def fetch(request):
+                data, request_headers = self.compress_body(
+                    request.get('data'), headers)
+                attempt = 0
+                while True:
+                    async with semaphore:
+                        response = await client.request(
+                            request['method'],
+                            self.build_url(request['path']),
+                            content=data or None, headers=request_headers)
+                    delay = retry_delay(request['method'],
+                                        response.status_code,
+                                        response.headers, attempt)
+                    if delay is None:
+                        return (self.decode_response(
+                            headers, response.content,
+                            response.headers.get('Content-Type')),
+                            response.status_code)
+                    attempt += 1
+                    await asyncio.sleep(delay)
+
+            return await asyncio.gather(*[fetch(request)
+                                          for request in requests_list])
+
+    async def send_requests_async(self, requests_list, headers):
+        '''
+        aiohttp implementation of send_requests(), multiplexing the whole
+        batch on a single event loop
+        '''
+        verify = self.connection.get_option('validate_certs')
+        # ssl=True means "no verification" to aiohttp before 3.9, None is
+        # its default verified context on every version
+        connector = aiohttp.TCPConnector(limit=POOL_MAXSIZE,
+                                         ttl_dns_cache=300,
+                                         ssl=None if verify else False)
+        timeout = aiohttp.ClientTimeout(
+            total=self.connection.get_option('persistent_command_timeout'))
+        # trust_env picks up the proxy settings requests would have used
+        async with aiohttp.ClientSession(
+                connector=connector, timeout=timeout, trust_env=True,
+                headers=dict(self._session.headers)) as session:
+
+            semaphore = asyncio.Semaphore(ASYNC_IN_FLIGHT)
+
+            async def fetch(request):
+                data, request_headers = self.compress_body(
+                    request.get('data'), headers)
+                attempt = 0
+                while True:
+                    async with semaphore, session.request(
+                            request['method'],
+                            self.build_url(request['path']),
+                            data=data, headers=request_headers) as response:
+                        content = await response.read()
+                    delay = retry_delay(request['method'], response.status,
+                                        response.headers, attempt)
+                    if delay is None:
+                        return (self.decode_response(
+                            headers, content,
+                            response.headers.get('Content-Type')),
+                            response.status)
+                    attempt += 1
+                    await asyncio.sleep(delay)
+
+            return await asyncio.gather(*[fetch(request)
+                                          for request in requests_list])
+
+    def build_url(self, path):
         host = self.connection.get_option('host')
         protocol = 'https' if self.connection.get_option('use_ssl') else 'http'
         self.url = '%s://%s%s' % (protocol, host, path)
+        return self.url
+
+    def send_files(self, requests_list):
+        '''
+        Uploads a batch of files concurrently. Each entry of requests_list is
+        a dict with "path", "method" and "filename". Returns a list of
+        (response_data, code) in the same order.
+        '''
+        self.valid_token()
+
+        def send(request):
+            return self.send_file(path=request['path'],
+                                  method=request['method'],
+                                  filename=request['filename'])
+
+        workers = min(FANOUT_WORKERS, len(requests_list)) or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(send, requests_list))
+
+    def send_file(self, path, method, filename):
+        self.valid_token()
+        # An upload may change what a cached read returns
+        self.invalidate_cache()
+        # Kept local, send_files() runs several uploads at once
+        url = self.build_url(path)
         verify = self.connection.get_option('validate_certs')
-        headers = {"Authorization": "Bearer " + self.access_token}
-        files = {}
-        if "template_variables" in path:
-            files = {"variables": open(filename, "rb")}
-        elif "templates" in path:
-            files = {"template": open(filename, "rb")}
-        session = requests.Session()
-        req = requests.Request(method=method, url=self.url, headers=headers,
-                               files=files)
-        prepped = session.prepare_request(req)
-        settings = session.merge_environment_settings(prepped.url, {}, None,
-                                                      verify, None)
-        response = session.send(prepped, **settings)
-        response_data = response.text
+        headers = {}
+        endpoint = path.split("?", 1)[0].rstrip("/")
+        field, part_type = _UPLOAD_FIELD_BY_SEGMENT.get(
+            endpoint.rsplit("/", 1)[-1], (None, None))
+        http2_client = self.http2_client()
+        with open(filename, "rb") as file_obj:
+            if http2_client is not None:
+                # httpx streams file parts from disk by itself
+                files = {field: (os.path.basename(filename), file_obj,
+                                 part_type)} if field else {}
+                response = http2_client.request(method, url,
+                                                headers=headers, files=files)
+            elif field and HAS_TOOLBELT:
+                # Stream the file from disk instead of building the whole
+                # multipart body in memory
+                encoder = MultipartEncoder(fields={
+                    field: (os.path.basename(filename), file_obj,
+                            part_type)})
+                headers["Content-Type"] = encoder.content_type
+                response = self._session.request(method, url,
+                                                 headers=headers,
+                                                 data=encoder, verify=verify)
+            elif field:
+                # Without requests-toolbelt the multipart body is read from
+                # disk piece by piece while it is sent. It has a length, so
+                # requests sends a Content-Length rather than chunking it.
+                boundary = uuid.uuid4().hex
+                body = MultipartBody(field, filename, file_obj, boundary,
+                                     part_type)
+                headers["Content-Type"] = ("multipart/form-data; boundary=" +
+                                           boundary)
+                response = self._session.request(method, url,
+                                                 headers=headers,
+                                                 data=body, verify=verify)
+            else:
+                response = self._session.request(method, url,
+                                                 headers=headers,
+                                                 files={}, verify=verify)
+        response_data = self.decode_response(
+            headers, response.content, response.headers.get('Content-Type'))
         return response_data, response.status_code
 
 
     def handle_response(self, response, response_data):
-        if response and response_data:
-            return response_data, response.code
+        # An empty body is a valid reply, e.g. 204 No Content on DELETE
+        if response is not None:
+            return response_data, response.status_code
+        return None, None
+
+
+def retry_delay(method, status, headers, attempt):
+    '''
+    Returns the seconds to wait before retrying a request of a concurrent
+    batch that got status, or None when it is not to be retried. Follows
+    RETRY_POLICY and honours Retry-After.
+    '''
+    if (attempt >= RETRY_POLICY["total"] or
+            status not in RETRY_POLICY["status_forcelist"] or
+            (status != 429 and method.upper() not in _IDEMPOTENT_METHODS)):
+        return None
+    try:
+        return max(float(headers.get("Retry-After")), 0)
+    except (TypeError, ValueError):
+        return RETRY_POLICY["backoff_factor"] * (2 ** attempt)
+
+
+def freshness_lifetime(headers):
+    '''
+    Returns for how many seconds a response may be reused without
+    revalidation according to its Cache-Control and Expires headers, or
+    None when it carries neither
+    '''
+    cache_control = headers.get('Cache-Control') or ''
+    for directive in cache_control.lower().split(','):
+        name, _, value = directive.strip().partition('=')
+        if name in ('no-cache', 'no-store'):
+            return 0
+        if name == 'max-age':
+            try:
+                return max(int(value.strip('"')), 0)
+            except ValueError:
+                return 0
+    expires = headers.get('Expires')
+    if not expires:
+        return None
+    try:
+        expires = parsedate_to_datetime(expires).timestamp()
+        date = headers.get('Date')
+        now = parsedate_to_datetime(date).timestamp() if date else time.time()
+    except (TypeError, ValueError, IndexError):
+        # An invalid Expires, e.g. "0", means already expired
+        return 0
+    return max(expires - now, 0)
+
+
+def read_etag_cache(cache_file):
+    '''
+    Returns a response cache entry for the response stored in cache_file.
+    Unless the response is still fresh, the entry is already expired so
+    that it is only used after revalidation.
+    '''
+    try:
+        with open(cache_file) as file_obj:
+            entry = json.load(file_obj)
+        # Stored as wall clock time, the monotonic clock restarts with the
+        # connection
+        remaining = entry.get("expires", 0) - time.time()
+        expires = time.monotonic() + remaining if remaining > 0 else 0
+        return expires, (entry["body"], entry["code"]), entry["etag"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def write_etag_cache(cache_file, etag, result, lifetime=0):
+    '''
+    Stores a response, its ETag and for how many more seconds it is fresh
+    in cache_file. Responses that are not JSON serializable, e.g. raw
+    bytes, are not stored.
+    '''
+    cache_dir = os.path.dirname(cache_file)
+    tmp_path = None
+    try:
+        # makedirs only applies mode to the leaf directory
+        os.makedirs(os.path.dirname(cache_dir), mode=0o700, exist_ok=True)
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        # mkstemp creates the file readable by its owner only
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as file_obj:
+            json.dump({"etag": etag, "body": result[0], "code": result[1],
+                       "expires": time.time() + lifetime}, file_obj)
+        os.replace(tmp_path, cache_file)
+    except (OSError, TypeError, ValueError):
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def is_large_json(response):
+    '''
+    Tells whether a streamed requests response is a JSON body big enough to
+    be parsed incrementally
+    '''
+    if not HAS_IJSON:
+        return False
+    content_type = response.headers.get('Content-Type') or ''
+    try:
+        length = int(response.headers.get('Content-Length') or 0)
+    except ValueError:
+        return False
+    return "json" in content_type and length > STREAM_JSON_THRESHOLD
+
+
+def stream_json(response, items_path=None):
+    '''
+    Parses a large JSON response with ijson while it is read from the socket,
+    so the raw body is never held in memory next to the decoded document
+    '''
+    # Let urllib3 inflate gzip encoded bodies, as response.content would
+    response.raw.decode_content = True
+    try:
+        if items_path:
+            return load_items(response.raw, items_path)
+        return next(ijson.items(response.raw, ""))
+    finally:
+        response.close()
+
+
+class MultipartBody(object):
+    '''
+    Read-only file-like multipart/form-data body holding file_obj as field.
+    The file is read from disk as the body is sent, one block at a time.
+    len() gives requests the Content-Length, and seek() lets the retry
+    policy send it again.
+    '''
+    def __init__(self, field, filename, file_obj, boundary,
+                 part_type="application/octet-stream"):
+        self._head = ('--%s\r\nContent-Disposition: form-data; name="%s"; '
+                      'filename="%s"\r\nContent-Type: %s\r\n\r\n' %
+                      (boundary, field, os.path.basename(filename),
+                       part_type)).encode()
+        self._tail = ('\r\n--%s--\r\n' % boundary).encode()
+        self._file = file_obj
+        self._file_start = file_obj.tell()
+        self._file_end = len(self._head) + (
+            os.fstat(file_obj.fileno()).st_size - self._file_start)
+        self._length = self._file_end + len(self._tail)
+        self._pos = 0
+
+    def __len__(self):
+        return self._length
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._length
+        self._pos = min(max(offset, 0), self._length)
+        return self._pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        chunks = []
+        while size > 0 and self._pos < self._length:
+            chunk = self._read_part(size)
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _read_part(self, size):
+        '''
+        Reads up to size bytes from the part (head, file or tail) at the
+        current position
+        '''
+        head_len = len(self._head)
+        if self._pos < head_len:
+            chunk = self._head[self._pos:self._pos + size]
+        elif self._pos < self._file_end:
+            self._file.seek(self._file_start + self._pos - head_len)
+            chunk = self._file.read(min(size, self._file_end - self._pos))
+            if not chunk:
+                raise IOError("%s shrank while it was being uploaded" %
+                              self._file.name)
+        else:
+            start = self._pos - self._file_end
+            chunk = self._tail[start:start + size]
+        self._pos += len(chunk)
+        return chunk
+
+
+def load_items(stream, items_path):
+    '''
+    Returns a JSON object response reduced to the records of the list at
+    items_path (in ijson prefix notation, e.g. "sites.item") and its
+    top-level scalar members such as "total", in the shape of the full
+    response. With ijson the body is parsed incrementally, so nothing else
+    in it is ever built.
+    '''
+    container = items_path[:-len(".item")]
+    if not HAS_IJSON:
+        document = load_json(stream.read())
+        if not isinstance(document, dict):
+            return document
+        result = {key: value for key, value in document.items()
+                  if not isinstance(value, (dict, list))}
+        result[container] = document.get(container, [])
+        return result
+    result = {container: []}
+    items = result[container]
+    builder = None
+    for prefix, event, value in ijson.parse(stream):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == items_path and event in ("end_map", "end_array"):
+                items.append(builder.value)
+                builder = None
+        elif prefix == items_path:
+            if event in ("start_map", "start_array"):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            else:
+                items.append(value)
+        elif "." not in prefix and prefix and event in (
+                "string", "number", "boolean", "null"):
+            result[prefix] = value
+    return result
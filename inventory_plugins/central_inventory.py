@@ -28,13 +28,15 @@ DOCUMENTATION = r"""
         description: This is the Aruba Central Access token obtained
                      from the API token on Central API gateway.
                      It is valid for only 7200 seconds or 2 hours.
-        required: true
+        required: false
+        default: null
       refresh_token:
         description: This is the Aruba Central Refresh token obtained
                      from the API token on Central API gateway. It is used
                      to renew an invalid access token, since access
                      token is valid only for 7200 seconds or 2 hours.
-        required: true
+        required: false
+        default: null
       client_id:
         description: This is the Aruba Central Client ID obtained from
                      API token list on My Apps & Token or System Apps & Tokens
@@ -51,12 +53,82 @@ DOCUMENTATION = r"""
                      is apigw-prod2.central.arubanetworks.com. This base url
                      is different for different clusters.
         required: true
+      cache_bootstrap:
+        description: When true, the groups returned by the call used to
+                     validate the access token (up to 20) are stored in the
+                     central_groups_cache host variable, so that tasks
+                     needing the group list can skip that API call.
+        type: bool
+        required: false
+        default: false
+      token_issued_at:
+        description: Unix time at which the access token was issued. Written
+                     by this plugin whenever it renews the tokens, so that a
+                     token close to its expiry is renewed in the background
+                     instead of being probed first.
+        type: int
+        required: false
+        default: null
+      use_http2:
+        description: When true and httpx is installed with HTTP/2 support,
+                     calls to the API gateway are multiplexed over a single
+                     HTTP/2 connection, both from this plugin and from the
+                     aruba_central httpapi plugin. Falls back to requests
+                     otherwise.
+        type: bool
+        required: false
+        default: false
 """
+import hashlib
 import json
-import yaml
-import requests
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from ansible.plugins.inventory import BaseInventoryPlugin
 from ansible.errors import AnsibleError, AnsibleParserError
+from ansible.utils.display import Display
+display = Display()
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Renewed access tokens are cached for slightly less than their 7200 second
+# lifetime. A user provided token may have been issued at any point in the
+# past, so once validated it is only trusted for a shorter window.
+TOKEN_LIFETIME = 7000
+VALIDATED_TOKEN_TTL = 1800
+TOKEN_CACHE_JITTER = 60
+TOKEN_REFRESH_WINDOW = 300
+# Largest page size accepted by /configuration/v2/groups
+BOOTSTRAP_GROUPS_LIMIT = 20
+TOKEN_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".ansible",
+                                "central_token_cache.json")
+
+# Maps the SHA-256 digest of an access token to the time until which it is
+# considered valid without asking the API gateway
+_TOKEN_CACHE = {}
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+_YAML_EXTS = frozenset((".yml", ".yaml"))
+
+INVALID_ACCESS_TOKEN = "<ENTER_VALID_ACCESS_TOKEN>"
+INVALID_REFRESH_TOKEN = "<ENTER_VALID_REFRESH_TOKEN>"
+
+# Shared across token validation and renewal so that both calls reuse the
+# same keep-alive connection to the API gateway. Created on first use, so
+# merely loading this plugin does not import requests or httpx.
+# _HTTP2_CLIENT is the httpx equivalent used with use_http2, or False if
+# HTTP/2 is unavailable.
+_SESSION = None
+_HTTP2_CLIENT = None
+_SESSION_LOCK = threading.Lock()
 
 class InventoryModule(BaseInventoryPlugin):
     '''
@@ -74,7 +146,10 @@ class InventoryModule(BaseInventoryPlugin):
         self.ref_tok = None
         self.client_id = None
         self.client_sec = None
+        self.use_http2 = False
+        self.token_issued_at = None
         self.api_gw = None
+        self.cache_bootstrap = False
 
     def verify_file(self, path):
         """Return true/false if this is a
@@ -82,8 +157,7 @@ class InventoryModule(BaseInventoryPlugin):
         """
         valid = False
         if super(InventoryModule, self).verify_file(path):
-            if path.endswith((".yml",
-                              ".yaml")):
+            if os.path.splitext(path)[1].lower() in _YAML_EXTS:
                 valid = True
         return valid
 
@@ -111,41 +185,92 @@ class InventoryModule(BaseInventoryPlugin):
                 self.host,
                 "ansible_httpapi_central_inv_plugin",
                 True)
+            if self.use_http2:
+                self.inventory.set_variable(
+                    self.host,
+                    "ansible_httpapi_central_use_http2",
+                    True)
+            if self.client_id is not None:
+                # Keeps the httpapi plugin's disk cache per Central account
+                self.inventory.set_variable(
+                    self.host,
+                    "ansible_httpapi_central_client_id",
+                    self.client_id)
 
             if self.acc_tok is not None:
 
-                if validate_token(self.api_gw, self.acc_tok):
-                    self.inventory.set_variable(
-                        self.host,
-                        "ansible_httpapi_central_access_token",
-                        self.acc_tok)
+                can_renew = (self.ref_tok is not None and
+                             self.client_id is not None and
+                             self.client_sec is not None)
+                expiry = token_expiry(self.acc_tok)
+                if self.token_issued_at:
+                    expiry = max(expiry,
+                                 self.token_issued_at + TOKEN_LIFETIME)
+                remaining = expiry - time.time()
+                renewal = None
+                groups = None
+                if (remaining > TOKEN_REFRESH_WINDOW and
+                        not self.cache_bootstrap):
+                    valid = True
+                elif (remaining > 0 and can_renew and
+                        not self.cache_bootstrap):
+                    # Still usable for this run, so keep it and renew it for
+                    # the next run without waiting on the API gateway
+                    valid = True
+                    self.renew_in_background()
+                else:
+                    limit = BOOTSTRAP_GROUPS_LIMIT if self.cache_bootstrap \
+                        else 1
+                    with ThreadPoolExecutor(max_workers=2) as executor:
+                        validation = executor.submit(
+                            validate_token, self.api_gw, self.acc_tok, limit,
+                            self.use_http2)
+                        if (expiry and can_renew and
+                                remaining <= TOKEN_REFRESH_WINDOW):
+                            # The token is known to be close to expiry, so
+                            # renew it while validation is still in flight
+                            renewal = executor.submit(
+                                token_renew, self.api_gw, self.ref_tok,
+                                self.client_id, self.client_sec,
+                                self.use_http2)
+                        valid, groups = validation.result()
+                    if valid:
+                        # Never trusted beyond its known expiry
+                        ttl = VALIDATED_TOKEN_TTL
+                        if expiry:
+                            ttl = min(ttl, expiry - time.time())
+                        if ttl > 0:
+                            cache_token(self.acc_tok, ttl)
 
-                elif (self.ref_tok is not None and
-                      self.client_id is not None and
-                      self.client_sec is not None):
-                    new_acc_tok, new_ref_tok = token_renew(
+                new_tokens = None
+                if renewal is not None:
+                    # A successful renewal revokes the old refresh token, so
+                    # its result is kept even if validation succeeded
+                    new_tokens = renewal.result()
+                    if valid and new_tokens[0] == INVALID_ACCESS_TOKEN:
+                        new_tokens = None
+                elif not valid and can_renew:
+                    new_tokens = token_renew(
                         self.api_gw,
                         self.ref_tok,
                         self.client_id,
-                        self.client_sec)
+                        self.client_sec,
+                        self.use_http2)
 
+                if new_tokens is not None:
+                    new_acc_tok, new_ref_tok = new_tokens
                     if new_acc_tok != "changeme":
-                        self.inv_data["access_token"] = new_acc_tok
-                        self.inv_data["refresh_token"] = new_ref_tok
-                        with open(self.inventory_file, "w") as inv:
-                            new_inv_data = {
-                                "api_gateway": self.api_gw,
-                                "host": self.host,
-                                "client_id": self.client_id,
-                                "plugin": self.plugin,
-                                "access_token": new_acc_tok,
-                                "client_secret": self.client_sec,
-                                "refresh_token": new_ref_tok}
-                            yaml.dump(new_inv_data, inv)
-                            self.inventory.set_variable(
-                                self.host,
-                                "ansible_httpapi_central_access_token",
-                                new_acc_tok)
+                        self.save_tokens(new_acc_tok, new_ref_tok)
+                        self.inventory.set_variable(
+                            self.host,
+                            "ansible_httpapi_central_access_token",
+                            new_acc_tok)
+
+                elif valid:
+                    self.inventory.set_variable(
+                        self.host,
+                        "ansible_httpapi_central_access_token",
+                        self.acc_tok)
 
                 else:
                     self.inventory.set_variable(
@@ -153,29 +278,105 @@ class InventoryModule(BaseInventoryPlugin):
                         "ansible_httpapi_central_access_token",
                         None)
 
+                if self.cache_bootstrap and groups is not None:
+                    self.inventory.set_variable(
+                        self.host,
+                        "central_groups_cache",
+                        groups)
+
         except Exception as err:
             raise AnsibleError(
                 "Use a valid credentials in the inventory "
                 "plugin config file. {}".format(err)) from None
 
+    def save_tokens(self, new_acc_tok, new_ref_tok):
+        """Write renewed tokens back to the inventory plugin config file"""
+        self.inv_data["access_token"] = new_acc_tok
+        self.inv_data["refresh_token"] = new_ref_tok
+        if new_acc_tok == INVALID_ACCESS_TOKEN:
+            self.inv_data.pop("token_issued_at", None)
+        else:
+            self.inv_data["token_issued_at"] = int(time.time())
+        # Start from the config as read so that optional settings such as
+        # cache_bootstrap are preserved. Its strings are AnsibleUnicode,
+        # which SafeDumper cannot represent.
+        self.write_inventory(plain_data(self.inv_data))
+
+    def renew_in_background(self):
+        """Renew the tokens on a separate thread and save them on success"""
+        def renew():
+            try:
+                new_acc_tok, new_ref_tok = token_renew(
+                    self.api_gw, self.ref_tok, self.client_id,
+                    self.client_sec, self.use_http2)
+                # The current token remains usable, so a failed renewal is
+                # not written back over it
+                if new_acc_tok == INVALID_ACCESS_TOKEN:
+                    return
+                self.save_tokens(new_acc_tok, new_ref_tok)
+            except Exception as err:
+                # Say so instead of letting the error die with this thread;
+                # if the renewal went through, the old refresh token is
+                # already revoked
+                display.warning(
+                    "Aruba Central tokens could not be renewed and written "
+                    "to {}: {}".format(self.inventory_file, err))
+
+        # Not a daemon thread: the renewal revokes the old refresh token, so
+        # the interpreter must wait for the new one to be written out
+        threading.Thread(target=renew, name="central_token_renew",
+                         daemon=False).start()
+
+    def write_inventory(self, new_inv_data):
+        """Atomically rewrite the inventory plugin config file"""
+        import yaml
+        try:
+            from yaml import CSafeDumper as SafeDumper
+        except ImportError:
+            from yaml import SafeDumper
+        # Serialize up front so nothing touches the disk if dumping fails
+        blob = yaml.dump(new_inv_data, Dumper=SafeDumper)
+        if not blob:
+            raise AnsibleError("Refusing to write an empty inventory plugin "
+                               "config file")
+        # mkstemp() creates the file readable by its owner only, since it
+        # holds the tokens and client secret until it replaces the config
+        fd, tmp_file = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.inventory_file)),
+            suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as inv:
+                inv.write(blob)
+            try:
+                shutil.copymode(self.inventory_file, tmp_file)
+            except OSError:
+                pass
+            os.replace(tmp_file, self.inventory_file)
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+
     def parse(self, inventory, loader, path, cache=True):
         '''
         Parses the inventory config source to generate
         dynamic inventory
         '''
         super(InventoryModule, self).parse(inventory, loader, path)
-        self._read_config_data(path)
-        self.inv_data = {}
-        self.inv_data.update(self._read_config_data(path))
+        # _read_config_data() loads the file through Ansible's DataLoader,
+        # which already uses the libyaml C loader when PyYAML provides it
+        self.inv_data = dict(self._read_config_data(path))
         try:
-            self.plugin = str(self.get_option("plugin"))
+            self.plugin = self.get_option("plugin")
             self.inventory_file = str(path)
-            self.host = str(self.get_option("host"))
-            self.acc_tok = str(self.get_option("access_token"))
-            self.ref_tok = str(self.get_option("refresh_token"))
-            self.client_id = str(self.get_option("client_id"))
-            self.client_sec = str(self.get_option("client_secret"))
-            self.api_gw = str(self.get_option("api_gateway"))
+            self.host = self.get_option("host")
+            self.acc_tok = self.get_option("access_token")
+            self.ref_tok = self.get_option("refresh_token")
+            self.client_id = self.get_option("client_id")
+            self.client_sec = self.get_option("client_secret")
+            self.api_gw = self.get_option("api_gateway")
+            self.cache_bootstrap = self.get_option("cache_bootstrap")
+            self.use_http2 = self.get_option("use_http2")
+            self.token_issued_at = self.get_option("token_issued_at")
 
         except Exception as err:
             raise AnsibleParserError(
@@ -184,46 +385,152 @@ class InventoryModule(BaseInventoryPlugin):
         self.populate()
 
 
-def token_renew(api_gateway, ref_tok, client_id, client_secret):
+def plain_data(value):
+    '''
+    Returns a copy of value loaded by Ansible's YAML loader with its str,
+    int, dict and list subclasses replaced by the builtin types, so that
+    yaml's SafeDumper can write it out
+    '''
+    if isinstance(value, dict):
+        return {plain_data(key): plain_data(val)
+                for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain_data(item) for item in value]
+    if isinstance(value, bool) or value is None:
+        return value
+    for builtin in (str, int, float):
+        if isinstance(value, builtin):
+            return builtin(value)
+    return value
+
+
+def _get_session(http2=False):
+    global _SESSION, _HTTP2_CLIENT
+    with _SESSION_LOCK:
+        if http2 and _HTTP2_CLIENT is None:
+            try:
+                import httpx
+                _HTTP2_CLIENT = httpx.Client(
+                    http2=True,
+                    limits=httpx.Limits(max_keepalive_connections=32))
+            except ImportError:
+                # httpx, or the h2 package http2=True needs, is missing
+                _HTTP2_CLIENT = False
+        if http2 and _HTTP2_CLIENT:
+            return _HTTP2_CLIENT
+        if _SESSION is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+            _SESSION = requests.Session()
+            _SESSION.headers.update({"Accept-Encoding": "gzip, deflate"})
+            # Only idempotent requests are retried, so the token renewal
+            # POST is never replayed
+            _SESSION.mount("https://", HTTPAdapter(max_retries=Retry(
+                total=3, backoff_factor=0.3,
+                status_forcelist=(429, 502, 503, 504),
+                raise_on_status=False)))
+    return _SESSION
+
+
+def token_renew(api_gateway, ref_tok, client_id, client_secret, http2=False):
     '''
     Renews an expired Access Token and returns a valid one
     using a valid Refresh Token, Client ID and Client Secret.
     '''
-    session = requests.Session()
     path = "/oauth2/token"
     url = "https://" + api_gateway + path
     params = {"client_id": client_id, "client_secret": client_secret,
               "grant_type": "refresh_token", "refresh_token": ref_tok}
-    req = requests.Request(method="POST", url=url, params=params)
-    prepped = session.prepare_request(req)
-    settings = session.merge_environment_settings(prepped.url, {},
-                                                  None, True, None)
-    response = session.send(prepped, **settings)
+    response = _get_session(http2).post(url, params=params)
+    new_acc_tok = INVALID_ACCESS_TOKEN
+    new_ref_tok = INVALID_REFRESH_TOKEN
     if response.status_code == 200:
-        new_acc_tok = json.loads(response.text)["access_token"]
-        new_ref_tok = json.loads(response.text)["refresh_token"]
-
-    elif response.status_code != 200:
-        new_ref_tok = "<ENTER_VALID_REFRESH_TOKEN>"
-        new_acc_tok = "<ENTER_VALID_ACCESS_TOKEN>"
+        try:
+            body = json_body(response)
+            new_acc_tok, new_ref_tok = (body["access_token"],
+                                        body["refresh_token"])
+            cache_token(new_acc_tok, TOKEN_LIFETIME)
+        except (KeyError, TypeError, ValueError):
+            pass
 
     return new_acc_tok, new_ref_tok
 
 
-def validate_token(api_gateway, acc_tok):
+def validate_token(api_gateway, acc_tok, limit=1, http2=False):
     '''
-    Checks the validity of the user provided Access Token
+    Checks the validity of the user provided Access Token. Returns a tuple of
+    the validity and the list of groups returned by the check, if any.
     '''
     valid = False
-    session = requests.Session()
+    groups = None
     headers = {"Authorization": "Bearer " + acc_tok}
-    path = "/configuration/v2/groups?limit=1&offset=0"
+    path = "/configuration/v2/groups?limit={}&offset=0".format(limit)
     url = "https://" + api_gateway + path
-    req = requests.Request(method="GET", url=url, headers=headers)
-    prepped = session.prepare_request(req)
-    settings = session.merge_environment_settings(prepped.url, {}, None,
-                                                  True, None)
-    response = session.send(prepped, **settings)
+    response = _get_session(http2).get(url, headers=headers)
     if response.status_code == 200:
         valid = True
-    return valid
+        try:
+            groups = json_body(response)["data"]
+        except (KeyError, TypeError, ValueError):
+            pass
+    return valid, groups
+
+
+def json_body(response):
+    '''
+    Decodes a JSON response body, using orjson when it is available
+    '''
+    if HAS_ORJSON:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+def _token_key(acc_tok):
+    return hashlib.sha256(acc_tok.encode("utf-8")).hexdigest()
+
+
+def _load_token_cache():
+    '''
+    Populates the in-memory token cache from the cache file on first use
+    '''
+    if not _TOKEN_CACHE:
+        try:
+            with open(TOKEN_CACHE_FILE) as cache_file:
+                _TOKEN_CACHE.update(json.load(cache_file))
+        except (IOError, OSError, ValueError):
+            pass
+    return _TOKEN_CACHE
+
+
+def token_expiry(acc_tok):
+    '''
+    Returns the time until which the Access Token is known to be valid, or 0
+    if it was not recently validated or renewed
+    '''
+    return _load_token_cache().get(_token_key(acc_tok), 0)
+
+
+def cache_token(acc_tok, ttl):
+    '''
+    Marks the Access Token as valid for the next ttl seconds and persists the
+    cache so that it survives across Ansible runs
+    '''
+    with _TOKEN_CACHE_LOCK:
+        now = time.time()
+        cache = _load_token_cache()
+        for key in [key for key, expiry in cache.items() if expiry <= now]:
+            del cache[key]
+        # Jitter keeps parallel runs from all revalidating at the same moment
+        cache[_token_key(acc_tok)] = now + ttl - random.uniform(
+            0, TOKEN_CACHE_JITTER)
+        try:
+            cache_dir = os.path.dirname(TOKEN_CACHE_FILE)
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            tmp_file = TOKEN_CACHE_FILE + ".tmp"
+            with open(tmp_file, "w") as cache_file:
+                json.dump(cache, cache_file)
+            os.replace(tmp_file, TOKEN_CACHE_FILE)
+        except (IOError, OSError):
+            pass
@@ -307,32 +307,64 @@ EXAMPLES = """
     sw_password: test@123
 """
 
-import json  # NOQA
 from ansible.module_utils.basic import AnsibleModule  # NOQA
 from ansible.module_utils.central_http import CentralApi  # NOQA
 
+# Number of device serials sent in each get_template_info request
+SERIALS_PER_REQUEST = 50
+# Number of device serials moved by each move_devices request
+SERIALS_PER_MOVE = 100
+# Seconds for which read actions may be answered from the responses cached
+# by the httpapi plugin
+RESPONSE_CACHE_TTL = 60
+
+_DEVICES_PATH = "/configuration/v1/devices"
+# Endpoint (or endpoint template) and request headers of each action. Both
+# are constant, so they are resolved once when the module is loaded.
+_PREBUILT = {
+    "move_devices": (_DEVICES_PATH + "/move",
+                     CentralApi.get_headers(False, "post")),
+    "get_device_group": (_DEVICES_PATH + "/{}/group",
+                         CentralApi.get_headers(False, "get")),
+    "get_running_config": (_DEVICES_PATH + "/{}/configuration",
+                           CentralApi.get_headers(True, "get")),
+    "get_config_details": (_DEVICES_PATH + "/{}/config_details",
+                           CentralApi.get_headers(True, "get")),
+    "get_template_info": (_DEVICES_PATH + "/template",
+                          CentralApi.get_headers(False, "get")),
+    "get_templates_for_groups": (_DEVICES_PATH + "/groups/template",
+                                 CentralApi.get_headers(False, "get")),
+    "get_templates_using_hash": (_DEVICES_PATH + "/{}/template",
+                                 CentralApi.get_headers(False, "get")),
+    "get_variablised_switch_template": (
+        _DEVICES_PATH + "/{}/variablised_template",
+        CentralApi.get_headers(True, "get")),
+    "set_switch_ssh_connection": (_DEVICES_PATH + "/{}/ssh_connection",
+                                  CentralApi.get_headers(False, "post")),
+}
+
+
+_ERROR_MSGS = {
+    "device_group": "Device serial number is not present in the playbook",
+    "running_cfg": "Device serial number is not present in the playbook",
+    "cfg_details": "Device serial number is not present in the playbook",
+    "sw_template": "Device serial number is not present in the playbook",
+    "move_devices": "Group name or device serial number list is not present"
+                    " in the playbook",
+    "templates_for_group": "Device type is not present in the playbook",
+    "templates_using_hash": "Device type is not present in the playbook",
+    "sw_ssh": "Device serial number, switch username, or switch password is"
+              " not present in playbook",
+}
+_ERROR_MSGS["template_info"] = _ERROR_MSGS["move_devices"]
+
 
 def error_msg(action):
     '''
     Error handler for errors related to missing playbook parameters for
     devices module
     '''
-    lst = ["device_group", "running_cfg", "cfg_details", "sw_template"]
-    result = {"resp": None, "code": 400}
-    if action in lst:
-        resp = "Device serial number is not present in the playbook"
-    elif action == "move_devices" or action == 'template_info':
-        resp = "Group name or device serial number list is not present in" \
-               " the playbook"
-    elif action in lst:
-        resp = "Device serial number is not present in the playbook"
-    elif action == "templates_for_group" or action == "templates_using_hash":
-        resp = "Device type is not present in the playbook"
-    elif action == "sw_ssh":
-        resp = "Device serial number, switch username, or switch password is" \
-               " not present in playbook"
-    result['resp'] = resp
-    return result
+    return {"resp": _ERROR_MSGS.get(action), "code": 400}
 
 
 def move_devices(central_api, group_name, device_serial_list):
@@ -340,11 +372,19 @@ def move_devices(central_api, group_name, device_serial_list):
     Moves devices (specified as a list of serial numbers) to a group
     '''
     if group_name is not None and device_serial_list is not None:
-        path = "/configuration/v1/devices/move"
-        headers = central_api.get_headers(False, "post")
-        data = {"group": group_name, "serials": device_serial_list}
-        result = central_api.post(path=path, headers=headers, data=data)
-        return result
+        path, headers = _PREBUILT["move_devices"]
+        if len(device_serial_list) <= SERIALS_PER_MOVE:
+            data = {"group": group_name, "serials": device_serial_list}
+            result = central_api.post(path=path, headers=headers, data=data)
+            return result
+        # Large moves are split into batches posted concurrently, any failed
+        # batch fails the whole action
+        data_list = [{"group": group_name,
+                      "serials": device_serial_list[i:i + SERIALS_PER_MOVE]}
+                     for i in range(0, len(device_serial_list),
+                                    SERIALS_PER_MOVE)]
+        return central_api.merge_results(
+            central_api.post_many(path, headers, data_list))
     return error_msg("move_devices")
 
 
@@ -353,9 +393,10 @@ def get_device_group(central_api, device_serial):
     Gets name of the group that a device belongs to
     '''
     if device_serial is not None:
-        path = "/configuration/v1/devices/"+str(device_serial)+"/group"
-        headers = central_api.get_headers(False, "get")
-        result = central_api.get(path=path, headers=headers)
+        path_tmpl, headers = _PREBUILT["get_device_group"]
+        path = path_tmpl.format(device_serial)
+        result = central_api.get(path=path, headers=headers,
+                                 cache_ttl=RESPONSE_CACHE_TTL)
         return result
     return error_msg("device_group")
 
@@ -365,9 +406,10 @@ def get_running_config(central_api, device_serial):
     Gets last known running configuration of a device (as multipart/form-data)
     '''
     if device_serial is not None:
-        path = "/configuration/v1/devices/"+str(device_serial)+"/configuration"
-        headers = central_api.get_headers(True, "get")
-        result = central_api.get(path=path, headers=headers)
+        path_tmpl, headers = _PREBUILT["get_running_config"]
+        path = path_tmpl.format(device_serial)
+        result = central_api.get(path=path, headers=headers,
+                                 cache_ttl=RESPONSE_CACHE_TTL)
         return result
     return error_msg("running_cfg")
 
@@ -382,12 +424,11 @@ def get_config_details(central_api, device_serial, full_details):
     - Template error details and status of device
     '''
     if device_serial is not None:
-        endpoint = "/configuration/v1/devices/" + str(device_serial) +\
-                   "/config_details"
-        query_params = {"details": full_details}
-        path = central_api.get_url(endpoint, query_params)
-        headers = central_api.get_headers(True, "get")
-        result = central_api.get(path=path, headers=headers)
+        path_tmpl, headers = _PREBUILT["get_config_details"]
+        endpoint = path_tmpl.format(device_serial)
+        path = central_api.build_url(endpoint, details=full_details)
+        result = central_api.get(path=path, headers=headers,
+                                 cache_ttl=RESPONSE_CACHE_TTL)
         return result
     return error_msg("cfg_details")
 
@@ -403,13 +444,19 @@ def get_template_meta_info(central_api, device_serial_list):
     - Device version for which the template is being used
     '''
     if device_serial_list is not None:
-        endpoint = "/configuration/v1/devices/template"
-        query_params = {"device_serials":
-                        central_api.get_list_params(device_serial_list)}
-        path = central_api.get_url(endpoint, query_params)
-        headers = central_api.get_headers(False, "get")
-        result = central_api.get(path=path, headers=headers)
-        return result
+        endpoint, headers = _PREBUILT["get_template_info"]
+        chunks = [device_serial_list[i:i + SERIALS_PER_REQUEST] for i in
+                  range(0, len(device_serial_list), SERIALS_PER_REQUEST)]
+        if len(chunks) <= 1:
+            path = central_api.build_url(
+                endpoint, device_serials=",".join(device_serial_list))
+            return central_api.get(path=path, headers=headers,
+                                   cache_ttl=RESPONSE_CACHE_TTL)
+        # Large lists are split into batches fetched concurrently
+        paths = [central_api.build_url(endpoint,
+                                       device_serials=",".join(chunk))
+                 for chunk in chunks]
+        return central_api.merge_results(central_api.get_many(paths, headers))
     return error_msg("template_info")
 
 
@@ -426,21 +473,22 @@ def get_templates_for_groups(central_api, **kwargs):
     '''
     if kwargs['device_type'] is not None:
         all_groups = True
-        endpoint = "/configuration/v1/devices/groups/template"
+        endpoint, headers = _PREBUILT["get_templates_for_groups"]
         key = "exclude_groups"
         groups = []
         if kwargs['exclude_groups']:
-            groups = central_api.get_list_params(kwargs['exclude_groups'])
+            groups = ",".join(kwargs['exclude_groups'])
         elif kwargs['include_groups']:
             key = "include_groups"
-            groups = central_api.get_list_params(kwargs['include_groups'])
+            groups = ",".join(kwargs['include_groups'])
             all_groups = False
-        query_params = {"limit": kwargs['limit'], "offset": kwargs['offset'],
-                        key: groups, "all_groups": all_groups,
-                        "device_type": kwargs['device_type']}
-        path = central_api.get_url(endpoint, query_params)
-        headers = central_api.get_headers(False, "get")
-        result = central_api.get(path=path, headers=headers)
+        path = central_api.build_url(endpoint, limit=kwargs['limit'],
+                                     offset=kwargs['offset'],
+                                     all_groups=all_groups,
+                                     device_type=kwargs['device_type'],
+                                     **{key: groups})
+        result = central_api.get(path=path, headers=headers,
+                                 cache_ttl=RESPONSE_CACHE_TTL)
         return result
     return error_msg("templates_for_group")
 
@@ -463,13 +511,16 @@ def get_templates_using_hash(central_api, template_hash, **kwargs):
     - Device version for which the template is being used
     '''
     if kwargs['device_type'] is not None:
-        endpoint = "/configuration/v1/devices/"+str(template_hash)+"/template"
-        query_params = {"limit": kwargs['limit'], "offset": kwargs['offset'],
-                        "exclude_hash": json.dumps(kwargs['exclude_hash']),
-                        "device_type": kwargs['device_type']}
-        path = central_api.get_url(endpoint, query_params)
-        headers = central_api.get_headers(False, "get")
-        result = central_api.get(path=path, headers=headers)
+        path_tmpl, headers = _PREBUILT["get_templates_using_hash"]
+        endpoint = path_tmpl.format(template_hash)
+        # exclude_hash is a bool (type='bool' in the argument spec), so the
+        # JSON literal can be picked directly without json.dumps()
+        path = central_api.build_url(
+            endpoint, limit=kwargs['limit'], offset=kwargs['offset'],
+            exclude_hash="true" if kwargs['exclude_hash'] else "false",
+            device_type=kwargs['device_type'])
+        result = central_api.get(path=path, headers=headers,
+                                 cache_ttl=RESPONSE_CACHE_TTL)
         return result
     return error_msg("templates_using_hash")
 
@@ -480,10 +531,10 @@ def get_variablised_switch_template(central_api, device_serial):
     as multipart/form-data
     '''
     if device_serial is not None:
-        path = "/configuration/v1/devices/" + str(device_serial) +\
-               "/variablised_template"
-        headers = central_api.get_headers(True, "get")
-        result = central_api.get(path=path, headers=headers)
+        path_tmpl, headers = _PREBUILT["get_variablised_switch_template"]
+        path = path_tmpl.format(device_serial)
+        result = central_api.get(path=path, headers=headers,
+                                 cache_ttl=RESPONSE_CACHE_TTL)
         return result
     return error_msg("sw_template")
 
@@ -495,78 +546,75 @@ def set_switch_ssh_connection(central_api, device_serial, sw_username,
     '''
     if device_serial is not None and sw_username is not None and\
             sw_password is not None:
-        path = "/configuration/v1/devices/" + str(device_serial) +\
-               "/ssh_connection"
-        headers = central_api.get_headers(False, "post")
+        path_tmpl, headers = _PREBUILT["set_switch_ssh_connection"]
+        path = path_tmpl.format(device_serial)
         data = {"username": sw_username, "password": sw_password}
         result = central_api.post(path=path, headers=headers, data=data)
         return result
     return error_msg("sw_ssh")
 
 
+# Maps each action to its handler and the playbook parameters it takes
+_ACTIONS = {
+    "move_devices": (move_devices, ("group_name", "device_serial_list")),
+    "get_device_group": (get_device_group, ("device_serial",)),
+    "get_running_config": (get_running_config, ("device_serial",)),
+    "get_config_details": (get_config_details,
+                           ("device_serial", "full_details")),
+    "get_template_info": (get_template_meta_info, ("device_serial_list",)),
+    "get_templates_for_groups": (get_templates_for_groups,
+                                 ("device_type", "limit", "offset",
+                                  "include_groups", "exclude_groups")),
+    "get_templates_using_hash": (get_templates_using_hash,
+                                 ("device_type", "limit", "offset",
+                                  "template_hash", "exclude_hash")),
+    "get_variablised_switch_template": (get_variablised_switch_template,
+                                        ("device_serial",)),
+    "set_switch_ssh_connection": (set_switch_ssh_connection,
+                                  ("device_serial", "sw_username",
+                                   "sw_password")),
+}
+# Parameters each action cannot do without and the error_msg() key used
+# when one of them is missing
+_REQUIRED = {
+    "move_devices": (("group_name", "device_serial_list"), "move_devices"),
+    "get_device_group": (("device_serial",), "device_group"),
+    "get_running_config": (("device_serial",), "running_cfg"),
+    "get_config_details": (("device_serial",), "cfg_details"),
+    "get_template_info": (("device_serial_list",), "template_info"),
+    "get_templates_for_groups": (("device_type",), "templates_for_group"),
+    "get_templates_using_hash": (("device_type",), "templates_using_hash"),
+    "get_variablised_switch_template": (("device_serial",), "sw_template"),
+    "set_switch_ssh_connection": (("device_serial", "sw_username",
+                                   "sw_password"), "sw_ssh"),
+}
+_ACTION_CHOICES = ("get_device_group", "get_running_config",
+                   "get_config_details", "get_template_info",
+                   "get_templates_for_groups", "get_templates_using_hash",
+                   "get_variablised_switch_template",
+                   "set_switch_ssh_connection", "move_devices")
+_MUTATING_ACTIONS = frozenset(("move_devices", "set_switch_ssh_connection"))
+
+
 def api_call(module):
     '''
     Uses playbook parameters to determine type of API request to be made
     '''
-    central_api = CentralApi(module)
-    action = module.params.get('action').lower()
-    group_name = module.params.get('group_name')
-    include_groups = module.params.get('include_groups')
-    exclude_groups = module.params.get('exclude_groups')
-    device_type = module.params.get('device_type')
-    full_details = module.params.get('full_details')
-    device_serial_list = module.params.get('device_serial_list')
-    template_hash = module.params.get('template_hash')
-    exclude_hash = module.params.get('exclude_hash')
-    limit = module.params.get('limit')
-    offset = module.params.get('offset')
-    device_serial = module.params.get('device_serial')
-    sw_username = module.params.get('sw_username')
-    sw_password = module.params.get('sw_password')
-
-    if action == "move_devices":
-        result = move_devices(central_api, group_name, device_serial_list)
-
-    elif action == "get_device_group":
-        result = get_device_group(central_api, device_serial)
-
-    elif action == "get_running_config":
-        result = get_running_config(central_api, device_serial)
-
-    elif action == "get_config_details":
-        result = get_config_details(central_api, device_serial, full_details)
-
-    elif action == "get_template_info":
-        result = get_template_meta_info(central_api, device_serial_list)
-
-    elif action == "get_templates_for_groups":
-        result = get_templates_for_groups(central_api=central_api,
-                                          device_type=device_type,
-                                          limit=limit,
-                                          include_groups=include_groups,
-                                          offset=offset,
-                                          exclude_groups=exclude_groups)
-
-    elif action == "get_templates_using_hash":
-        result = get_templates_using_hash(central_api=central_api,
-                                          device_type=device_type,
-                                          limit=limit,
-                                          template_hash=template_hash,
-                                          offset=offset,
-                                          exclude_hash=exclude_hash)
-
-    elif action == "get_variablised_switch_template":
-        result = get_variablised_switch_template(central_api, device_serial)
-
-    elif action == "set_switch_ssh_connection":
-        result = set_switch_ssh_connection(central_api, device_serial,
-                                           sw_username, sw_password)
-
-    else:
+    action = module.params['action'].lower()
+    try:
+        handler, keys = _ACTIONS[action]
+    except KeyError:
         module.fail_json(changed=False,
                          msg="Unsupported action provided in playbook")
 
-    return result
+    # Missing parameters are reported before any connection is set up
+    required, error_key = _REQUIRED[action]
+    if any(module.params[key] is None for key in required):
+        return error_msg(error_key)
+
+    central_api = CentralApi(module)
+    return handler(central_api, **dict((key, module.params[key])
+                                       for key in keys))
 
 
 def main():
@@ -577,20 +625,14 @@ def main():
     module = AnsibleModule(
         argument_spec=dict(
             action=dict(required=True, type='str',
-                        choices=["get_device_group", "get_running_config",
-                                 "get_config_details", "get_template_info",
-                                 "get_templates_for_groups",
-                                 "get_templates_using_hash",
-                                 "get_variablised_switch_template",
-                                 "set_switch_ssh_connection",
-                                 "move_devices"]),
+                        choices=list(_ACTION_CHOICES)),
             group_name=dict(required=False, type='str'),
             limit=dict(required=False, type='int', default=20),
             offset=dict(required=False, type='int', default=0),
             device_serial=dict(required=False, type='str'),
             device_serial_list=dict(required=False, type='list'),
-            include_groups=dict(required=False, type='list', default=[]),
-            exclude_groups=dict(required=False, type='list', default=[]),
+            include_groups=dict(required=False, type='list', default=None),
+            exclude_groups=dict(required=False, type='list', default=None),
             template_hash=dict(required=False, type='str'),
             exclude_hash=dict(required=False, type='bool', default=False),
             full_details=dict(required=False, type='bool', default=False),
@@ -600,18 +642,11 @@ def main():
                              choices=["IAP", "CX", "ArubaSwitch",
                                       "MobilityController"])
             ))
-    success_codes = [200, 201]
+    success_codes = [200, 201, 204]
     exit_codes = [304, 400, 404]
-    changed = False
-    if "get" not in module.params.get('action').lower():
-        changed = True
+    changed = module.params['action'] in _MUTATING_ACTIONS
     result = api_call(module)
 
-    try:
-        result['resp'] = json.loads(result['resp'])
-    except (TypeError, ValueError):
-        pass
-
     if result['code'] and result['code'] in success_codes:
         module.exit_json(changed=changed, msg=result['resp'],
                          response_code=result['code'])
@@ -43,20 +43,29 @@ options:
         description:
             - Action to be performed on the group(s)
             - "get_groups" gets names of existing groups
+            - "get_groups_all_pages" gets names of all existing groups,
+              fetching every page of "limit" records concurrently
             - "get_group_mode" gets group modes of existing groups
             - "clone" creates a new group by cloning an existing group
             - "update" updates the group password of an existing UI group
             - "create" creates a new group
             - "delete" deletes an existing group
+            - "create_many" creates every group in "group_list" with the same
+              "group_attributes", in throttled concurrent batches
+            - "delete_many" deletes every group in "group_list", in throttled
+              concurrent batches
         required: true
         type: str
         choices:
             - get_groups
+            - get_groups_all_pages
             - get_group_mode
             - clone
             - update
             - create
             - delete
+            - create_many
+            - delete_many
     group_name:
         description:
             - Name of the group
@@ -66,8 +75,9 @@ options:
     group_list:
         description:
             - List of group names
-            - At most 20 names can be listed
-            - Used with action "get_group_mode"
+            - At most 20 names can be listed with action "get_group_mode"
+            - Used with actions "get_group_mode", "create_many" and
+              "delete_many"
         required: false
         type: list
     group_attributes:
@@ -89,6 +99,8 @@ options:
         description:
             - Maximum number of records to be returned
             - Used optionally as a filter parameter for "get_groups"
+            - Page size used by "get_groups_all_pages", must be greater than
+              0 there
         required: false
         type: int
         default: 20
@@ -97,9 +109,25 @@ options:
             - Number of items to be skipped before returning the data, which
               is useful for pagination
             - Used optionally as a filter parameter for "get_groups"
+            - Offset of the first page fetched by "get_groups_all_pages"
         required: false
         type: int
         default: 0
+    async_concurrency:
+        description:
+            - Number of groups created or deleted concurrently per batch
+            - Used with actions "create_many" and "delete_many", must be
+              greater than 0 there
+        required: false
+        type: int
+        default: 100
+    batch_delay:
+        description:
+            - Seconds to wait between two batches
+            - Used with actions "create_many" and "delete_many"
+        required: false
+        type: float
+        default: 3
 
 """
 EXAMPLES = """
@@ -110,6 +138,10 @@ EXAMPLES = """
     limit: 20
     offset: 0
 
+- name: Get every group on Central, the pages are fetched concurrently
+  central_groups:
+    action: get_groups_all_pages
+
 - name: Get groups' configuration modes ("UI" or "template")
   central_groups:
     action: get_group_mode
@@ -146,30 +178,52 @@ EXAMPLES = """
     action: delete
     group_name: new-test-group
 
+- name: Delete several groups, 50 at a time with a 5 second pause
+  central_groups:
+    action: delete_many
+    group_list:
+      - new-test-group-1
+      - new-test-group-2
+    async_concurrency: 50
+    batch_delay: 5
+
 """
 
-import json  # NOQA
 from ansible.module_utils.basic import AnsibleModule  # NOQA
 from ansible.module_utils.central_http import CentralApi  # NOQA
 
+# Seconds for which read actions may be answered from the responses cached
+# by the httpapi plugin. Any create, update or delete clears that cache.
+RESPONSE_CACHE_TTL = 15
+
+_GROUP_PATH = "/configuration/v1/groups/{}"
+
+# Request headers are the same for every call, resolve them once
+_GET_HEADERS = CentralApi.get_headers(False, "get")
+_POST_HEADERS = CentralApi.get_headers(False, "post")
+_DELETE_HEADERS = CentralApi.get_headers(False, "delete")
+
+
+_ERROR_MSGS = {
+    "create": "Group name or Group attributes not present in the playbook",
+    "delete": "Group name to be deleted not present in the playbook",
+    "clone": "Group name or clone-from-group parameters not present in the"
+             " playbook",
+    "get": "List of groups (group_list) not present in the playbook",
+    "create_many": "List of groups (group_list) or Group attributes not"
+                   " present in the playbook",
+    "delete_many": "List of groups (group_list) to be deleted not present in"
+                   " the playbook",
+}
+_ERROR_MSGS["update"] = _ERROR_MSGS["create"]
+
 
 def error_msg(method):
     '''
     Error handler for errors related to missing playbook parameters for groups
     module
     '''
-    result = {"resp": None, "code": 400}
-    if method == "create" or method == "update":
-        resp = "Group name or Group attributes not present in the playbook"
-    elif method == "delete":
-        resp = "Group name to be deleted not present in the playbook"
-    elif method == "clone":
-        resp = "Group name or clone-from-group parameters not present in " \
-               "the playbook"
-    elif method == "get":
-        resp = "List of groups (group_list) not present in the playbook"
-    result['resp'] = resp
-    return result
+    return {"resp": _ERROR_MSGS.get(method), "code": 400}
 
 
 def get_groups(central_api, limit, offset):
@@ -178,12 +232,39 @@ def get_groups(central_api, limit, offset):
     '''
     endpoint = "/configuration/v2/groups"
     query_params = {"limit": limit, "offset": offset}
-    headers = central_api.get_headers(False, "get")
+    headers = _GET_HEADERS
     path = central_api.get_url(endpoint, query_params)
-    result = central_api.get(path=path, headers=headers)
+    # Each group is a one element list under "data"
+    result = central_api.get(path=path, headers=headers,
+                             stream_items_path="data.item",
+                             cache_ttl=RESPONSE_CACHE_TTL)
     return result
 
 
+def get_groups_all_pages(central_api, limit, offset):
+    '''
+    Gets names of all existing Central Groups. The first page reports the
+    total number of groups, the remaining pages are then fetched at once.
+    '''
+    result = get_groups(central_api, limit, offset)
+    if result['code'] != 200 or not isinstance(result['resp'], dict):
+        return result
+    total = result['resp'].get('total') or 0
+    endpoint = "/configuration/v2/groups"
+    headers = _GET_HEADERS
+    paths = [central_api.get_url(endpoint, {"limit": limit,
+                                            "offset": page_offset})
+             for page_offset in range(offset + limit, total, limit)]
+    if not paths:
+        return result
+    merged = central_api.merge_results(
+        [result] + central_api.get_many(paths, headers))
+    if isinstance(merged['resp'], dict):
+        # Every page reports the same total, it must not be added up
+        merged['resp']['total'] = total
+    return merged
+
+
 def get_group_mode(central_api, group_list):
     '''
     Gets group modes of existing Central Groups
@@ -191,10 +272,11 @@ def get_group_mode(central_api, group_list):
     if group_list is not None:
         groups = central_api.get_list_params(group_list)
         query_params = {"groups": groups}
-        headers = central_api.get_headers(False, "get")
+        headers = _GET_HEADERS
         path = central_api.get_url("/configuration/v2/groups/template_info",
                                    query_params)
-        result = central_api.get(path=path, headers=headers)
+        result = central_api.get(path=path, headers=headers,
+                                 cache_ttl=RESPONSE_CACHE_TTL)
         return result
     return error_msg("get")
 
@@ -206,27 +288,34 @@ def clone(central_api, group_name, clone_from_group):
     if group_name and clone_from_group is not None:
         path = "/configuration/v2/groups/clone"
         data = {"group": group_name, "clone_group": clone_from_group}
-        headers = central_api.get_headers(False, "post")
+        headers = _POST_HEADERS
         result = central_api.post(path=path, headers=headers, data=data)
         return result
     return error_msg("clone")
 
 
+def group_data(group_name, group_attributes):
+    '''
+    Builds the request body used to create a group
+    '''
+    return {
+        "group": group_name,
+        "group_attributes": {
+            "group_password": group_attributes['group_password'],
+            "template_info": {
+                "Wired": group_attributes['template_group']['wired'],
+                "Wireless": group_attributes['template_group']['wireless']
+            }}}
+
+
 def create_group(central_api, group_name, group_attributes):
     '''
     Creates a new template or UI group based on group_attributes
     '''
     if group_name and group_attributes is not None:
         path = "/configuration/v2/groups"
-        data = {
-            "group": group_name,
-            "group_attributes": {
-                "group_password": group_attributes['group_password'],
-                "template_info": {
-                    "Wired": group_attributes['template_group']['wired'],
-                    "Wireless": group_attributes['template_group']['wireless']
-                }}}
-        headers = central_api.get_headers(False, "post")
+        data = group_data(group_name, group_attributes)
+        headers = _POST_HEADERS
         result = central_api.post(path=path, headers=headers, data=data)
         return result
     return error_msg("create")
@@ -237,9 +326,9 @@ def update_group(central_api, group_name, group_attributes):
     Updates an existing UI group to change its password
     '''
     if group_name and group_attributes is not None:
-        path = "/configuration/v1/groups/"+str(group_name)
+        path = _GROUP_PATH.format(group_name)
         data = group_attributes
-        headers = central_api.get_headers(False, "post")
+        headers = _POST_HEADERS
         result = central_api.patch(path=path, headers=headers, data=data)
         return result
     return error_msg("update")
@@ -250,49 +339,92 @@ def delete_group(central_api, group_name):
     Deletes an existing group
     '''
     if group_name is not None:
-        path = "/configuration/v1/groups/"+str(group_name)
-        headers = central_api.get_headers(False, "delete")
+        path = _GROUP_PATH.format(group_name)
+        headers = _DELETE_HEADERS
         result = central_api.delete(path=path, headers=headers)
         return result
     return error_msg("delete")
 
 
-def api_call(module):
+def create_many(central_api, group_list, group_attributes, async_concurrency,
+                batch_delay):
     '''
-    Uses playbook parameters to determine type of API request to be made
+    Creates several groups sharing the same group_attributes, in batches of
+    async_concurrency concurrent requests separated by batch_delay seconds
     '''
-    central_api = CentralApi(module)
-    action = module.params.get('action').lower()
-    group_name = module.params.get('group_name')
-    group_list = module.params.get('group_list')
-    group_attributes = module.params.get('group_attributes')
-    limit = module.params.get('limit')
-    offset = module.params.get('offset')
-    clone_from_group = module.params.get('clone_from_group')
-
-    if action == "get_groups":
-        result = get_groups(central_api, limit, offset)
-
-    elif action == "get_group_mode":
-        result = get_group_mode(central_api, group_list)
-
-    elif action == "clone":
-        result = clone(central_api, group_name, clone_from_group)
-
-    elif action == "create":
-        result = create_group(central_api, group_name, group_attributes)
-
-    elif action == "update":
-        result = update_group(central_api, group_name, group_attributes)
+    if group_list and group_attributes is not None:
+        headers = _POST_HEADERS
+        requests_list = [{"path": "/configuration/v2/groups", "method": "POST",
+                          "data": group_data(group_name, group_attributes)}
+                         for group_name in group_list]
+        results, code = central_api.send_batches(
+            requests_list, headers, async_concurrency, batch_delay)
+        return {"resp": [result._asdict() for result in results],
+                "code": code}
+    return error_msg("create_many")
+
+
+def delete_many(central_api, group_list, async_concurrency, batch_delay):
+    '''
+    Deletes several groups, in batches of async_concurrency concurrent
+    requests separated by batch_delay seconds
+    '''
+    if group_list:
+        headers = _DELETE_HEADERS
+        requests_list = [{"path": _GROUP_PATH.format(name),
+                          "method": "DELETE"} for name in group_list]
+        results, code = central_api.send_batches(
+            requests_list, headers, async_concurrency, batch_delay)
+        return {"resp": [result._asdict() for result in results],
+                "code": code}
+    return error_msg("delete_many")
+
+
+# Maps each action to its handler and the playbook parameters it takes
+_ACTIONS = {
+    "get_groups": (get_groups, ("limit", "offset")),
+    "get_groups_all_pages": (get_groups_all_pages, ("limit", "offset")),
+    "get_group_mode": (get_group_mode, ("group_list",)),
+    "clone": (clone, ("group_name", "clone_from_group")),
+    "create": (create_group, ("group_name", "group_attributes")),
+    "update": (update_group, ("group_name", "group_attributes")),
+    "delete": (delete_group, ("group_name",)),
+    "create_many": (create_many, ("group_list", "group_attributes",
+                                  "async_concurrency", "batch_delay")),
+    "delete_many": (delete_many, ("group_list", "async_concurrency",
+                                  "batch_delay")),
+}
+_MUTATING_ACTIONS = frozenset(("clone", "create", "update", "delete",
+                               "create_many", "delete_many"))
+_ARG_SPEC = dict(
+    action=dict(required=True, type='str', choices=list(_ACTIONS)),
+    limit=dict(required=False, type='int', default=20),
+    offset=dict(required=False, type='int', default=0),
+    group_list=dict(required=False, type='list'),
+    group_name=dict(required=False, type='str'),
+    group_attributes=dict(required=False, type='dict'),
+    clone_from_group=dict(required=False, type='str'),
+    async_concurrency=dict(required=False, type='int', default=100),
+    batch_delay=dict(required=False, type='float', default=3)
+)
+_SUCCESS_CODES = frozenset((200, 201, 204))
+_EXIT_CODES = frozenset((304, 400, 404))
 
-    elif action == "delete":
-        result = delete_group(central_api, group_name)
 
-    else:
+def api_call(module):
+    '''
+    Uses playbook parameters to determine type of API request to be made
+    '''
+    action = module.params['action'].lower()
+    try:
+        handler, keys = _ACTIONS[action]
+    except KeyError:
         module.fail_json(changed=False,
                          msg="Unsupported action provided in playbook")
 
-    return result
+    central_api = CentralApi(module)
+    return handler(central_api, **dict((key, module.params[key])
+                                       for key in keys))
 
 
 def main():
@@ -300,37 +432,25 @@ def main():
     Central Groups related parameters definitions and response handling for
     module
     '''
-    module = AnsibleModule(
-        argument_spec=dict(
-            action=dict(required=True, type='str', choices=["get_groups",
-                                                            "get_group_mode",
-                                                            "clone", "update",
-                                                            "create",
-                                                            "delete"]),
-            limit=dict(required=False, type='int', default=20),
-            offset=dict(required=False, type='int', default=0),
-            group_list=dict(required=False, type='list'),
-            group_name=dict(required=False, type='str'),
-            group_attributes=dict(required=False, type='dict'),
-            clone_from_group=dict(required=False, type='str')
-            ))
-
-    success_codes = [200, 201]
-    exit_codes = [304, 400, 404]
-    changed = False
-    if "get" not in module.params.get('action'):
-        changed = True
+    module = AnsibleModule(argument_spec=_ARG_SPEC)
+    if (module.params['action'] == "get_groups_all_pages" and
+            module.params['limit'] <= 0):
+        # The pages are stepped through limit records at a time
+        module.fail_json(changed=False, msg="limit must be a positive page"
+                         " size for get_groups_all_pages")
+    if (module.params['action'] in ("create_many", "delete_many") and
+            module.params['async_concurrency'] <= 0):
+        # The groups are sent async_concurrency requests at a time
+        module.fail_json(changed=False, msg="async_concurrency must be a"
+                         " positive batch size for create_many and"
+                         " delete_many")
+    changed = module.params['action'] in _MUTATING_ACTIONS
     result = api_call(module)
 
-    try:
-        result['resp'] = json.loads(result['resp'])
-    except (TypeError, ValueError):
-        pass
-
-    if result['code'] and result['code'] in success_codes:
+    if result['code'] and result['code'] in _SUCCESS_CODES:
         module.exit_json(changed=changed, msg=result['resp'],
                          response_code=result['code'])
-    elif result['code'] and result['code'] in exit_codes:
+    elif result['code'] and result['code'] in _EXIT_CODES:
         module.exit_json(changed=False, msg=result['resp'],
                          response_code=result['code'])
     else:
@@ -46,6 +46,8 @@ options:
             - "get" gets details of a particular site
             - "get_multiple_sites" gets number of sites and details of each
               site
+            - "get_multiple_sites_by_id" gets details of each site in
+              "site_id_list", fetched concurrently
             - "create" creates a new site
                 - Either geolocation OR "site_address" should be specified,
                   but not both
@@ -55,16 +57,23 @@ options:
             - "associate" associates devices to a site
             - "unassociate" unassociates devices from a site
             - "delete" deletes a site
+            - "create_many" creates every site in "site_list", in throttled
+              concurrent batches
+            - "delete_many" deletes every site in "site_id_list", in
+              throttled concurrent batches
         required: true
         type: str
         choices:
             - get
             - get_multiple_sites
+            - get_multiple_sites_by_id
             - create
             - update
             - associate
             - unassociate
             - delete
+            - create_many
+            - delete_many
     site_id:
         description:
             - Numerical ID of the site
@@ -72,6 +81,13 @@ options:
               and "delete"
         required: false
         type: int
+    site_id_list:
+        description:
+            - List of numerical site IDs
+            - Used with actions "get_multiple_sites_by_id" and "delete_many"
+        required: false
+        type: list
+        elements: int
     site_name:
         description:
             - Name of the site
@@ -147,7 +163,8 @@ options:
     device_list:
         description:
             - List of device serial numbers
-            - A maximum of 5000 device serial numbers are allowed
+            - Up to 5000 device serial numbers are sent per request, longer
+              lists are split into concurrent requests of 5000
             - Used with actions "associate" and "unassociate"
         required: false
         type: list
@@ -178,6 +195,29 @@ options:
         choices:
             - +site_name
             - -site_name
+    site_list:
+        description:
+            - List of sites to create, each a dictionary with "site_name"
+              and either "site_address" or "geolocation"
+            - Used with action "create_many"
+        required: false
+        type: list
+        elements: dict
+    async_concurrency:
+        description:
+            - Number of sites created or deleted concurrently per batch
+            - Used with actions "create_many" and "delete_many", must be
+              greater than 0 there
+        required: false
+        type: int
+        default: 100
+    batch_delay:
+        description:
+            - Seconds to wait between two batches
+            - Used with actions "create_many" and "delete_many"
+        required: false
+        type: float
+        default: 3
 """
 EXAMPLES = """
 #Usage Examples
@@ -194,6 +234,14 @@ EXAMPLES = """
     offset: 0
     limit: 20
 
+- name: Get site details for several sites by their IDs
+  central_sites:
+    action: get_multiple_sites_by_id
+    site_id_list:
+      - 40
+      - 41
+      - 42
+
 - name: Create a new site using site address
   central_sites:
     action: create
@@ -234,7 +282,7 @@ EXAMPLES = """
       latitude: 18.3241334
       longitude: -122.5132145
 
-- name: Associate devices to a site
+- name: Associate devices to a site, all in one task rather than a loop
   central_sites:
     action: associate
     site_id: 43
@@ -257,36 +305,66 @@ EXAMPLES = """
   central_sites:
     action: delete
     site_id: 42
+
+- name: Create several sites, 50 at a time with a 5 second pause
+  central_sites:
+    action: create_many
+    site_list:
+      - site_name: test-site-1
+        geolocation:
+          latitude: 37.3861
+          longitude: -122.0839
+      - site_name: test-site-2
+        geolocation:
+          latitude: 37.4419
+          longitude: -122.1430
+    async_concurrency: 50
+    batch_delay: 5
 """
 
-import json  # NOQA
 from ansible.module_utils.basic import AnsibleModule  # NOQA
 from ansible.module_utils.central_http import CentralApi  # NOQA
 
+# Seconds for which read actions may be answered from the responses cached
+# by the httpapi plugin. Any create, update or delete clears that cache.
+RESPONSE_CACHE_TTL = 15
+
+_SITE_PATH = "/central/v2/sites/{}"
+
+# Request headers are the same for every call, resolve them once
+_GET_HEADERS = CentralApi.get_headers(False, "get")
+_POST_HEADERS = CentralApi.get_headers(False, "post")
+_DELETE_HEADERS = CentralApi.get_headers(False, "delete")
+
+# Largest device list accepted by a single site association request
+DEVICES_PER_ASSOCIATION = 5000
+
+
+_ERROR_MSGS = {
+    "get_site": "Side ID is not present in the playbook",
+    "get_sites": "List of site IDs (site_id_list) is not present in the"
+                 " playbook",
+    "site_info": "Either geolocation or site address can be used for creating"
+                 " or updatiing a site, not both.",
+    "create_site": "Check if site name and either geolocation or site address"
+                   " are present in the playbook.",
+    "update_site": "Check if site name and a valid site ID, along with either"
+                   " geolocation or site address, are present in the"
+                   " playbook.",
+    "create_many": "Check if every entry of site_list has a site name and"
+                   " either geolocation or site address.",
+    "association": "Site ID, device type, or device list not present in the"
+                   " playbook.",
+}
+_ERROR_MSGS["delete"] = _ERROR_MSGS["get_site"]
+
 
 def error_msg(reason):
     '''
     Error handler for errors related to missing playbook parameters in sites
     module
     '''
-    result = {"resp": None, "code": 400}
-    if reason == "get_site" or reason == "delete":
-        resp = "Side ID is not present in the playbook"
-    elif reason == "site_info":
-        resp = ("Either geolocation or site address can be used for creating"
-                " or updatiing a site, not both.")
-    elif reason == "create_site":
-        resp = ("Check if site name and either geolocation or site address are"
-                " present in the playbook.")
-    elif reason == "update_site":
-        resp = ("Check if site name and a valid site ID, along with either"
-                " geolocation or site address, are present in the playbook.")
-    elif reason == "association":
-        resp = ("Site ID, device type, or device list not present in the"
-                " playbook.")
-
-    result['resp'] = resp
-    return result
+    return {"resp": _ERROR_MSGS.get(reason), "code": 400}
 
 
 def get_site(central_api, site_id):
@@ -294,46 +372,84 @@ def get_site(central_api, site_id):
     Gets details of a particular site, by site ID
     '''
     if site_id is not None:
-        path = "/central/v2/sites/" + str(site_id)
-        headers = central_api.get_headers(False, "get")
-        result = central_api.get(path=path, headers=headers)
+        path = _SITE_PATH.format(site_id)
+        headers = _GET_HEADERS
+        result = central_api.get(path=path, headers=headers,
+                                 cache_ttl=RESPONSE_CACHE_TTL)
         return result
     return error_msg("get_site")
 
 
-def get_multiple_sites(central_api, filters):
+def get_multiple_sites(central_api, calculate_total, limit, offset, sort):
     '''
     Gets site information for multiple sites, with optional filters to
     filter the output
     '''
     endpoint = "/central/v2/sites"
-    query_params = filters
+    query_params = {"calculate_total": calculate_total, "limit": limit,
+                    "offset": offset, "sort": sort}
     path = central_api.get_url(endpoint, query_params)
-    headers = central_api.get_headers(False, "get")
-    result = central_api.get(path=path, headers=headers)
+    headers = _GET_HEADERS
+    result = central_api.get(path=path, headers=headers,
+                             stream_items_path="sites.item",
+                             cache_ttl=RESPONSE_CACHE_TTL)
     return result
 
 
-def create_site(central_api, data):
+def get_multiple_sites_by_id(central_api, site_id_list):
+    '''
+    Gets details of each site in a list of site IDs, fetching them all
+    concurrently. Returns the sites in the order of the list.
+    '''
+    if site_id_list is not None:
+        headers = _GET_HEADERS
+        paths = [_SITE_PATH.format(site_id) for site_id in site_id_list]
+        results = central_api.get_many(paths, headers)
+        for result in results:
+            if result['code'] != 200:
+                return result
+        return {"resp": [result['resp'] for result in results], "code": 200}
+    return error_msg("get_sites")
+
+
+def site_data(site_name, site_address, geolocation):
+    '''
+    Builds the request body for creating or updating a site. Returns None
+    when both or neither of site address and geolocation are given.
+    '''
+    if (site_address is None) == (geolocation is None):
+        return None
+    if site_address is not None:
+        return {"site_name": site_name, "site_address": site_address}
+    return {"site_name": site_name, "geolocation": geolocation}
+
+
+def create_site(central_api, site_name, site_address, geolocation):
     '''
     Creates a new site with site name and site address/geolocation. If
     successful, returns the site ID of the newly created site
     '''
-    if data and data['site_name'] is not None:
+    if site_address is not None and geolocation is not None:
+        return error_msg("site_info")
+    data = site_data(site_name, site_address, geolocation)
+    if data and site_name is not None:
         path = "/central/v2/sites"
-        headers = central_api.get_headers(False, "get")
+        headers = _GET_HEADERS
         result = central_api.post(path=path, data=data, headers=headers)
         return result
     return error_msg("create_site")
 
 
-def update_site(central_api, site_id, data):
+def update_site(central_api, site_id, site_name, site_address, geolocation):
     '''
     Updates or modifies site name and/or site address/geolocation
     '''
-    if site_id is not None and data['site_name'] is not None:
-        path = "/central/v2/sites/"+str(site_id)
-        headers = central_api.get_headers(False, "get")
+    if site_address is not None and geolocation is not None:
+        return error_msg("site_info")
+    data = site_data(site_name, site_address, geolocation)
+    if site_id is not None and data and site_name is not None:
+        path = _SITE_PATH.format(site_id)
+        headers = _GET_HEADERS
         result = central_api.patch(path=path, data=data, headers=headers)
         return result
     return error_msg("update_site")
@@ -344,13 +460,48 @@ def delete_site(central_api, site_id):
     Deletes an existing site by site ID
     '''
     if site_id is not None:
-        path = "/central/v2/sites/"+str(site_id)
-        headers = central_api.get_headers(False, "get")
+        path = _SITE_PATH.format(site_id)
+        headers = _GET_HEADERS
         result = central_api.delete(path=path, headers=headers)
         return result
     return error_msg("delete")
 
 
+def create_many(central_api, site_list, async_concurrency, batch_delay):
+    '''
+    Creates several sites, in batches of async_concurrency concurrent
+    requests separated by batch_delay seconds
+    '''
+    if site_list and all(site.get('site_name') is not None and
+                         (site.get('site_address') is None) !=
+                         (site.get('geolocation') is None)
+                         for site in site_list):
+        headers = _POST_HEADERS
+        requests_list = [{"path": "/central/v2/sites", "method": "POST",
+                          "data": site} for site in site_list]
+        results, code = central_api.send_batches(
+            requests_list, headers, async_concurrency, batch_delay)
+        return {"resp": [result._asdict() for result in results],
+                "code": code}
+    return error_msg("create_many")
+
+
+def delete_many(central_api, site_id_list, async_concurrency, batch_delay):
+    '''
+    Deletes several sites by site ID, in batches of async_concurrency
+    concurrent requests separated by batch_delay seconds
+    '''
+    if site_id_list:
+        headers = _DELETE_HEADERS
+        requests_list = [{"path": _SITE_PATH.format(site_id),
+                          "method": "DELETE"} for site_id in site_id_list]
+        results, code = central_api.send_batches(
+            requests_list, headers, async_concurrency, batch_delay)
+        return {"resp": [result._asdict() for result in results],
+                "code": code}
+    return error_msg("get_sites")
+
+
 def site_association(central_api, action, site_id, device_type, device_list):
     '''
     Associates/unassociates devices to/from a site by the specified list of
@@ -359,7 +510,20 @@ def site_association(central_api, action, site_id, device_type, device_list):
     if site_id is not None and device_type is not None and device_list\
             is not None:
         path = "/central/v2/sites/associations"
-        headers = central_api.get_headers(False, "post")
+        headers = _POST_HEADERS
+        if len(device_list) > DEVICES_PER_ASSOCIATION:
+            # The API accepts at most 5000 devices per call, larger lists
+            # are sent as concurrent batches and the results combined
+            data_list = [{"site_id": site_id, "device_type": device_type,
+                          "device_ids": device_list[i:i +
+                                                    DEVICES_PER_ASSOCIATION]}
+                         for i in range(0, len(device_list),
+                                        DEVICES_PER_ASSOCIATION)]
+            if action == "associate":
+                results = central_api.post_many(path, headers, data_list)
+            elif action == "unassociate":
+                results = central_api.delete_many(path, headers, data_list)
+            return central_api.merge_results(results)
         data = {"site_id": site_id, "device_type": device_type,
                 "device_ids": device_list}
         if action == "associate":
@@ -370,59 +534,75 @@ def site_association(central_api, action, site_id, device_type, device_list):
     return error_msg("association")
 
 
+# Maps each action to its handler and the playbook parameters it takes
+_ACTIONS = {
+    "get": (get_site, ("site_id",)),
+    "get_multiple_sites": (get_multiple_sites,
+                           ("calculate_total", "limit", "offset", "sort")),
+    "get_multiple_sites_by_id": (get_multiple_sites_by_id, ("site_id_list",)),
+    "create": (create_site, ("site_name", "site_address", "geolocation")),
+    "update": (update_site, ("site_id", "site_name", "site_address",
+                             "geolocation")),
+    "delete": (delete_site, ("site_id",)),
+    "associate": (site_association, ("action", "site_id", "device_type",
+                                     "device_list")),
+    "unassociate": (site_association, ("action", "site_id", "device_type",
+                                       "device_list")),
+    "create_many": (create_many, ("site_list", "async_concurrency",
+                                  "batch_delay")),
+    "delete_many": (delete_many, ("site_id_list", "async_concurrency",
+                                  "batch_delay")),
+}
+_MUTATING_ACTIONS = frozenset(("create", "update", "delete", "associate",
+                               "unassociate", "create_many", "delete_many"))
+_ARG_SPEC = dict(
+    action=dict(required=True, type='str', choices=list(_ACTIONS)),
+    site_id=dict(required=False, type='int'),
+    site_id_list=dict(required=False, type='list', elements='int'),
+    site_name=dict(required=False, type='str'),
+    site_address=dict(required=False, type='dict', default=None,
+                      options=dict(
+                          address=dict(require=True, type='str'),
+                          city=dict(require=True, type='str'),
+                          state=dict(require=True, type='str'),
+                          country=dict(require=True, type='str'),
+                          zipcode=dict(require=False, type='str',
+                                       default='')
+                       )),
+    geolocation=dict(required=False, type='dict', default=None,
+                     options=dict(
+                         latitude=dict(require=False, type='str'),
+                         longitude=dict(require=False, type='str')
+                      )),
+    calculate_total=dict(required=False, type='bool', default=True),
+    limit=dict(required=False, type='int', default=100),
+    offset=dict(required=False, type='int', default=0),
+    sort=dict(required=False, type='str', default="+site_name"),
+    device_list=dict(required=False, type='list', default=None),
+    device_type=dict(required=False, type='str',
+                     choices=["SWITCH", "IAP", "CONTROLLER"]),
+    site_list=dict(required=False, type='list', elements='dict'),
+    async_concurrency=dict(required=False, type='int', default=100),
+    batch_delay=dict(required=False, type='float', default=3)
+)
+_SUCCESS_CODES = frozenset((200, 201, 204))
+_EXIT_CODES = frozenset((304, 400, 404))
+
+
 def api_call(module):
     '''
     Uses playbook parameters to determine type of API request to be made
     '''
-    central_api = CentralApi(module)
-    action = module.params.get('action').lower()
-    site_id = module.params.get('site_id')
-    site_name = module.params.get('site_name')
-    site_address = module.params.get('site_address')
-    geolocation = module.params.get('geolocation')
-    device_list = module.params.get('device_list')
-    filters = {"calculate_total": module.params.get('calculate_total'),
-               "limit": module.params.get('limit'),
-               "offset": module.params.get('offset'),
-               "sort": module.params.get('sort')}
-    device_type = module.params.get('device_type')
-
-    if action == "get":
-        result = get_site(central_api, site_id)
-
-    elif action == "get_multiple_sites":
-        result = get_multiple_sites(central_api, filters)
-
-    elif action == 'delete':
-        result = delete_site(central_api, site_id)
-
-    elif action == "associate" or action == "unassociate":
-        result = site_association(central_api, action, site_id, device_type,
-                                  device_list)
-
-    elif action == 'create' or action == 'update':
-        data = {}
-        site_dict = {"site_name": site_name}
-        addr_dict = {"site_address": site_address}
-        geo_dict = {"geolocation": geolocation}
-        if geolocation is not None and site_address is not None:
-            result = error_msg("site_info")
-            module.exit_json(changed=False, msg=result['resp'],
-                             response_code=result['code'])
-        elif site_address is not None:
-            data = dict(list(site_dict.items()) + list(addr_dict.items()))
-        elif geolocation is not None:
-            data = dict(list(site_dict.items()) + list(geo_dict.items()))
-        if action == "create":
-            result = create_site(central_api, data)
-        elif action == "update":
-            result = update_site(central_api, site_id, data)
-
-    else:
+    action = module.params['action'].lower()
+    try:
+        handler, keys = _ACTIONS[action]
+    except KeyError:
         module.fail_json(changed=False, msg="Unsupported action provided in"
                                             " playbook")
 
-    return result
+    central_api = CentralApi(module)
+    return handler(central_api, **dict((key, module.params[key])
+                                       for key in keys))
 
 
 def main():
@@ -430,53 +610,20 @@ def main():
     Central sites-related parameter definitions and response handling for
     module
     '''
-    module = AnsibleModule(
-        argument_spec=dict(
-            action=dict(required=True, type='str',
-                        choices=["get", "get_multiple_sites", "create",
-                                 "delete", "update", "associate",
-                                 "unassociate"]),
-            site_id=dict(required=False, type='int'),
-            site_name=dict(required=False, type='str'),
-            site_address=dict(required=False, type='dict', default=None,
-                              options=dict(
-                                  address=dict(require=True, type='str'),
-                                  city=dict(require=True, type='str'),
-                                  state=dict(require=True, type='str'),
-                                  country=dict(require=True, type='str'),
-                                  zipcode=dict(require=False, type='str',
-                                               default='')
-                               )),
-            geolocation=dict(required=False, type='dict', default=None,
-                             options=dict(
-                                 latitude=dict(require=False, type='str'),
-                                 longitude=dict(require=False, type='str')
-                              )),
-            calculate_total=dict(required=False, type='bool', default=True),
-            limit=dict(required=False, type='int', default=100),
-            offset=dict(required=False, type='int', default=0),
-            sort=dict(required=False, type='str', default="+site_name"),
-            device_list=dict(required=False, type='list', default=None),
-            device_type=dict(required=False, type='str',
-                             choices=["SWITCH", "IAP",
-                                      "CONTROLLER"]),
-            ))
-    success_codes = [200, 201]
-    exit_codes = [304, 400, 404]
-    changed = False
-    if "get" not in module.params.get('action'):
-        changed = True
+    module = AnsibleModule(argument_spec=_ARG_SPEC)
+    if (module.params['action'] in ("create_many", "delete_many") and
+            module.params['async_concurrency'] <= 0):
+        # The sites are sent async_concurrency requests at a time
+        module.fail_json(changed=False, msg="async_concurrency must be a"
+                         " positive batch size for create_many and"
+                         " delete_many")
+    changed = module.params['action'] in _MUTATING_ACTIONS
     result = api_call(module)
 
-    try:
-        result['resp'] = json.loads(result['resp'])
-    except (TypeError, ValueError):
-        pass
-
-    if result['code'] and result['code'] in success_codes:
+    if result['code'] and result['code'] in _SUCCESS_CODES:
         module.exit_json(changed=changed, msg=result['resp'],
                          response_code=result['code'])
-    elif result['code'] and result['code'] in exit_codes:
+    elif result['code'] and result['code'] in _EXIT_CODES:
         module.exit_json(changed=False, msg=result['resp'],
                          response_code=result['code'])
     else:
@@ -68,6 +68,17 @@ options:
               "delete"
         required: false
         type: str
+    targets:
+        description:
+            - List of dictionaries with the keys "template_name" and,
+              optionally, "group_name" (defaults to group_name), each naming
+              a template whose text is to be fetched
+            - Used optionally with action "get_template_text" in place of
+              template_name, fetching all the templates concurrently
+            - Returns the result of every target, in order
+        required: false
+        type: list
+        elements: dict
     device_type:
         description:
             - Type of device for which the template file is applicable
@@ -124,6 +135,31 @@ options:
         required: false
         type: int
         default: 0
+    template_list:
+        description:
+            - List of dictionaries, each describing a template to upload with
+              the keys "template_name", "local_file_path" and "device_type",
+              and optionally "version" and "model" (both default to ALL) and
+              "group_name" (defaults to group_name)
+            - Used with actions "create" and "update" in place of the single
+              template parameters, uploading the templates in throttled
+              concurrent batches
+        required: false
+        type: list
+        elements: dict
+    async_concurrency:
+        description:
+            - Number of templates of template_list uploaded concurrently in
+              each batch, must be greater than 0
+        required: false
+        type: int
+        default: 20
+    batch_delay:
+        description:
+            - Seconds to wait between two batches of template_list uploads
+        required: false
+        type: float
+        default: 2
 
 """
 EXAMPLES = """
@@ -151,6 +187,15 @@ EXAMPLES = """
     group_name: new-group
     template_name: iap-temp
 
+- name: Get the text of several templates at once
+  central_templates:
+    action: get_template_text
+    group_name: new-group
+    targets:
+      - template_name: iap-temp
+      - template_name: switch-temp
+        group_name: other-group
+
 - name: Upload a new template file and create a new template for a given device type  # NOQA
   central_templates:
     action: create
@@ -161,6 +206,20 @@ EXAMPLES = """
     model: ALL
     local_file_path: /home/iap_template.txt
 
+- name: Upload several templates, 10 at a time with 5 seconds between batches
+  central_templates:
+    action: create
+    group_name: new-group
+    async_concurrency: 10
+    batch_delay: 5
+    template_list:
+      - template_name: iap-temp
+        device_type: IAP
+        local_file_path: /home/iap_template.txt
+      - template_name: cx-temp
+        device_type: CX
+        local_file_path: /home/cx_template.txt
+
 - name: Update an existing template
   central_templates:
     action: update
@@ -179,10 +238,22 @@ EXAMPLES = """
 
 """
 
-import json  # NOQA
 from ansible.module_utils.basic import AnsibleModule  # NOQA
 from ansible.module_utils.central_http import CentralApi  # NOQA
 
+# Seconds for which read actions may be answered from the responses cached
+# by the httpapi plugin
+RESPONSE_CACHE_TTL = 60
+
+_TEMPLATES_PATH = "/configuration/v1/groups/{}/templates"
+_TEMPLATE_PATH = _TEMPLATES_PATH + "/{}"
+
+# Request headers are the same for every call, resolve them once
+_GET_HEADERS = CentralApi.get_headers(False, "get")
+_MULTIPART_GET_HEADERS = CentralApi.get_headers(True, "get")
+_MULTIPART_POST_HEADERS = CentralApi.get_headers(True, "post")
+_DELETE_HEADERS = CentralApi.get_headers(False, "delete")
+
 
 def error_msg(action):
     '''
@@ -192,6 +263,11 @@ def error_msg(action):
     result = {"resp": None, "code": 400}
     if action == "get_template_text" or action == "delete":
         resp = "Template name is not present in the playbook"
+    if action == "targets":
+        resp = "Every entry of targets needs a template name"
+    if action == "template_list":
+        resp = "Every entry of template_list needs a template name, device" \
+               " type, and local file path"
     if action == "create" or action == "update":
         resp = "Template name, device type, or local file path is not" \
                " present in the playbook"
@@ -199,18 +275,21 @@ def error_msg(action):
     return result
 
 
-def get_all_templates(central_api, group_name, **kwargs):
+def get_all_templates(central_api, group_name, limit, offset, template_name,
+                      device_type, version, model):
     '''
     Used to get info on all templates in a group
     '''
-    endpoint = "/configuration/v1/groups/" + str(group_name) + "/templates"
-    query_params = {}
-    headers = central_api.get_headers(False, "get")
-    for key, val in kwargs.items():
-        if val is not None:
-            query_params[key] = val
+    endpoint = _TEMPLATES_PATH.format(group_name)
+    filters = {"limit": limit, "offset": offset, "template": template_name,
+               "device_type": device_type, "version": version,
+               "model": model}
+    query_params = {key: val for key, val in filters.items()
+                    if val is not None}
+    headers = _GET_HEADERS
     path = central_api.get_url(endpoint, query_params)
-    result = central_api.get(path=path, headers=headers)
+    result = central_api.get(path=path, headers=headers,
+                             cache_ttl=RESPONSE_CACHE_TTL)
     return result
 
 
@@ -220,35 +299,82 @@ def get_template_text(central_api, group_name, template_name):
     devices
     '''
     if template_name is not None:
-        path = "/configuration/v1/groups/" + str(group_name) + "/templates/" +\
-               str(template_name)
-        headers = central_api.get_headers(True, "get")
-        result = central_api.get(path=path, headers=headers)
+        path = _TEMPLATE_PATH.format(group_name, template_name)
+        headers = _MULTIPART_GET_HEADERS
+        result = central_api.get(path=path, headers=headers,
+                                 cache_ttl=RESPONSE_CACHE_TTL)
         return result
     return error_msg("get_template_text")
 
 
-def create_update_template(central_api, group_name, template_name, **kwargs):
+def get_template_texts(central_api, group_name, targets):
+    '''
+    Used to get the text of every template listed in targets, fetching them
+    all concurrently
+    '''
+    if targets and all(target.get('template_name') is not None
+                       for target in targets):
+        paths = [_TEMPLATE_PATH.format(target.get('group_name') or group_name,
+                                       target['template_name'])
+                 for target in targets]
+        headers = _MULTIPART_GET_HEADERS
+        results = central_api.get_many(paths, headers)
+        return {"resp": [result._asdict() for result in results],
+                "code": central_api.overall_code(results)}
+    return error_msg("targets")
+
+
+def create_update_template(central_api, action, group_name, template_name,
+                           device_type, version, model, local_file_path):
     '''
     Used to upload and create a new group template for various devices, as
     well as change attributes for an existing template
     '''
-    if None not in kwargs.values() and template_name is not None:
-        endpoint = "/configuration/v1/groups/"+str(group_name)+"/templates"
-        query_params = {"name": template_name,
-                        "device_type": kwargs['device_type'],
-                        "version": kwargs['version'], "model": kwargs['model']}
-        headers = central_api.get_headers(True, "post")
-        path = central_api.get_url(endpoint, query_params)
-        filepath = kwargs['file']
-        if kwargs['action'] == "create":
-            result = central_api.post(path=path, headers=headers,
-                                      filename=filepath)
-        elif kwargs['action'] == "update":
-            result = central_api.patch(path=path, headers=headers,
-                                       filename=filepath)
-        return result
-    return error_msg("create")
+    if not all((template_name, device_type, version, model,
+                local_file_path)):
+        return error_msg("create")
+    endpoint = _TEMPLATES_PATH.format(group_name)
+    query_params = {"name": template_name, "device_type": device_type,
+                    "version": version, "model": model}
+    headers = _MULTIPART_POST_HEADERS
+    path = central_api.get_url(endpoint, query_params)
+    if action == "create":
+        result = central_api.post(path=path, headers=headers,
+                                  filename=local_file_path)
+    elif action == "update":
+        result = central_api.patch(path=path, headers=headers,
+                                   filename=local_file_path)
+    return result
+
+
+def create_update_many(central_api, action, group_name, template_list,
+                       async_concurrency, batch_delay):
+    '''
+    Used to upload every template of template_list, in batches of
+    async_concurrency concurrent uploads separated by batch_delay seconds
+    '''
+    keys = ("template_name", "device_type", "local_file_path")
+    if not template_list or any(template.get(key) is None
+                                for template in template_list
+                                for key in keys):
+        return error_msg("template_list")
+    method = "POST" if action == "create" else "PATCH"
+    requests_list = []
+    for template in template_list:
+        endpoint = _TEMPLATES_PATH.format(template.get('group_name') or
+                                          group_name)
+        query_params = {"name": template['template_name'],
+                        "device_type": template['device_type'],
+                        "version": template.get('version') or "ALL",
+                        "model": template.get('model') or "ALL"}
+        requests_list.append({"path": central_api.get_url(endpoint,
+                                                          query_params),
+                              "method": method,
+                              "filename": template['local_file_path']})
+    results, code = central_api.send_file_batches(
+        requests_list, async_concurrency, batch_delay)
+    return {"resp": [result._asdict() for result in results],
+            "code": code}
 
 
 def delete_template(central_api, group_name, template_name):
@@ -256,57 +382,74 @@ def delete_template(central_api, group_name, template_name):
     Used to delete an existing template from an existing group
     '''
     if template_name is not None:
-        headers = central_api.get_headers(False, "delete")
-        path = "/configuration/v1/groups/" + str(group_name) + "/templates/"\
-               + str(template_name)
+        headers = _DELETE_HEADERS
+        path = _TEMPLATE_PATH.format(group_name, template_name)
         result = central_api.delete(path=path, headers=headers)
         return result
     return error_msg("delete")
 
 
-def api_call(module):
+# Maps each action to its handler and the playbook parameters it takes
+_ACTIONS = {
+    "get_template_text": (get_template_text, ("group_name", "template_name")),
+    "get_all": (get_all_templates, ("group_name", "limit", "offset",
+                                    "template_name", "device_type",
+                                    "version", "model")),
+    "create": (create_update_template, ("action", "group_name",
+                                        "template_name", "device_type",
+                                        "version", "model",
+                                        "local_file_path")),
+    "update": (create_update_template, ("action", "group_name",
+                                        "template_name", "device_type",
+                                        "version", "model",
+                                        "local_file_path")),
+    "delete": (delete_template, ("group_name", "template_name")),
+}
+# Actions that take a list parameter in place of their single-item
+# parameters: the list parameter, and the handler and parameters used when
+# it is set. These handlers check their parameters themselves.
+_BULK_ACTIONS = {
+    "get_template_text": ("targets", get_template_texts,
+                          ("group_name", "targets")),
+    "create": ("template_list", create_update_many,
+               ("action", "group_name", "template_list", "async_concurrency",
+                "batch_delay")),
+    "update": ("template_list", create_update_many,
+               ("action", "group_name", "template_list", "async_concurrency",
+                "batch_delay")),
+}
+# Parameters each action cannot do without and the error_msg() key used
+# when one of them is missing
+_REQUIRED = {
+    "get_template_text": (("template_name",), "get_template_text"),
+    "create": (("template_name", "device_type", "local_file_path"), "create"),
+    "update": (("template_name", "device_type", "local_file_path"), "update"),
+    "delete": (("template_name",), "delete"),
+}
+
+
+def api_call(module, action):
     '''
     Uses playbook parameters to determine type of API request to be made
     '''
-    central_api = CentralApi(module)
-    action = module.params.get('action').lower()
-    group_name = module.params.get('group_name')
-    template_name = module.params.get('template_name')
-    limit = module.params.get('limit')
-    offset = module.params.get('offset')
-    device_type = module.params.get('device_type')
-    version = module.params.get('version')
-    model = module.params.get('model')
-    local_file_path = module.params.get('local_file_path')
-
-    if action == "get_template_text":
-        result = get_template_text(central_api, group_name, template_name)
-
-    elif action == "get_all":
-        result = get_all_templates(central_api=central_api,
-                                   group_name=group_name,
-                                   limit=limit, offset=offset,
-                                   template=template_name,
-                                   device_type=device_type, version=version,
-                                   model=model)
-
-    elif action == "create" or action == "update":
-        result = create_update_template(central_api=central_api,
-                                        group_name=group_name,
-                                        template_name=template_name,
-                                        device_type=device_type,
-                                        version=version, model=model,
-                                        action=action,
-                                        file=local_file_path)
-
-    elif action == "delete":
-        result = delete_template(central_api, group_name, template_name)
-
+    bulk = _BULK_ACTIONS.get(action)
+    if bulk is not None and module.params[bulk[0]] is not None:
+        handler, keys = bulk[1:]
     else:
-        module.fail_json(changed=False, msg="Unsupported or no action provided"
-                                            " in playbook")
+        try:
+            handler, keys = _ACTIONS[action]
+        except KeyError:
+            module.fail_json(changed=False, msg="Unsupported or no action"
+                                                " provided in playbook")
 
-    return result
+        # Missing parameters are reported before any connection is set up
+        required, error_key = _REQUIRED.get(action, ((), None))
+        if any(module.params[key] is None for key in required):
+            return error_msg(error_key)
+
+    central_api = CentralApi(module)
+    params = dict(module.params, action=action)
+    return handler(central_api, **dict((key, params[key]) for key in keys))
 
 
 def main():
@@ -328,19 +471,24 @@ def main():
                                       "MobilityController"]),
             version=dict(required=False, type='str', default="ALL"),
             model=dict(required=False, type='str', default="ALL"),
-            local_file_path=dict(required=False, type='path', default=None)
+            local_file_path=dict(required=False, type='path', default=None),
+            targets=dict(required=False, type='list', elements='dict',
+                         default=None),
+            template_list=dict(required=False, type='list', elements='dict',
+                               default=None),
+            async_concurrency=dict(required=False, type='int', default=20),
+            batch_delay=dict(required=False, type='float', default=2)
             ))
-    success_codes = [200, 201]
+    success_codes = [200, 201, 204]
     exit_codes = [304, 400, 404]
-    changed = False
-    if "get" not in module.params.get('action'):
-        changed = True
-    result = api_call(module)
-
-    try:
-        result['resp'] = json.loads(result['resp'])
-    except (TypeError, ValueError):
-        pass
+    action = module.params['action'].lower()
+    if (module.params['template_list'] is not None and
+            module.params['async_concurrency'] <= 0):
+        # template_list is uploaded async_concurrency files at a time
+        module.fail_json(changed=False, msg="async_concurrency must be a"
+                         " positive batch size for template_list")
+    changed = "get" not in action
+    result = api_call(module, action)
 
     if result['code'] and result['code'] in success_codes:
         module.exit_json(changed=changed, msg=result['resp'],
@@ -80,6 +80,16 @@ options:
               and "delete"
         required: false
         type: str
+    targets:
+        description:
+            - List of dictionaries with the key "device_serial", each naming
+              a device whose variables are to be fetched
+            - Used optionally with action "get" in place of device_serial,
+              fetching the variables of all the devices concurrently
+            - Returns the result of every target, in order
+        required: false
+        type: list
+        elements: dict
     device_mac:
         description:
             - MAC address of the device
@@ -116,6 +126,17 @@ options:
             - Used with actions "create_all", "update_all", and "replace_all"
         required: false
         type: str
+    variables_list:
+        description:
+            - List of dictionaries, each with the keys "device_serial",
+              "device_mac" and "variables", for setting variables of many
+              devices in a single request
+            - Used with actions "create" and "update" in place of
+              device_serial, device_mac and variables. The list is uploaded
+              as one JSON file, as with "create_all" and "update_all"
+        required: false
+        type: list
+        elements: dict
 
 """
 EXAMPLES = """
@@ -125,6 +146,13 @@ EXAMPLES = """
     action: get
     device_serial: CNXXXXXXXX
 
+- name: Get variables for several devices at once
+  central_variables:
+    action: get
+    targets:
+      - device_serial: CNXXXXXXXX
+      - device_serial: CNYYYYYYYY
+
 - name: Get variables for all(20) devices
   central_variables:
     action: get_all
@@ -147,6 +175,21 @@ EXAMPLES = """
       vc_name: Instant-AP_VC
       hostname: IAP-1
 
+- name: Create/set template variables for several devices in one request
+  central_variables:
+    action: create
+    variables_list:
+      - device_serial: CNXXXXXXXX
+        device_mac: aa:aa:aa:bb:bb:bb
+        variables:
+          zonename: First-Floor
+          hostname: IAP-1
+      - device_serial: CNYYYYYYYY
+        device_mac: aa:aa:aa:cc:cc:cc
+        variables:
+          zonename: Second-Floor
+          hostname: IAP-2
+
 - name: Update template variables for all/multiple devices using a JSON file
   central_variables:
     action: update_all
@@ -180,9 +223,23 @@ EXAMPLES = """
     device_serial: CNXXXXXXXX
 """
 
-import json  # NOQA
+import os  # NOQA
+import tempfile  # NOQA
 from ansible.module_utils.basic import AnsibleModule  # NOQA
-from ansible.module_utils.central_http import CentralApi  # NOQA
+from ansible.module_utils.central_http import CentralApi, dump_json  # NOQA
+
+# Seconds for which read actions may be answered from the responses cached
+# by the httpapi plugin
+RESPONSE_CACHE_TTL = 60
+
+_ALL_VARIABLES_PATH = "/configuration/v1/devices/template_variables"
+_DEVICE_VARIABLES_PATH = "/configuration/v1/devices/{}/template_variables"
+
+# Request headers are the same for every call, resolve them once
+_GET_HEADERS = CentralApi.get_headers(False, "get")
+_MULTIPART_POST_HEADERS = CentralApi.get_headers(True, "post")
+_POST_HEADERS = CentralApi.get_headers(False, "post")
+_DELETE_HEADERS = CentralApi.get_headers(False, "delete")
 
 
 def error_msg(action):
@@ -198,6 +255,11 @@ def error_msg(action):
                " are not present in playbook"
     elif action == "set_all":
         resp = "Local file path is not present in the playbook"
+    elif action == "targets":
+        resp = "Every entry of targets needs a device serial number"
+    elif action == "set_list":
+        resp = "Every entry of variables_list needs a device serial number," \
+               " MAC address, and variable definitions"
     result['resp'] = resp
     return result
 
@@ -207,24 +269,41 @@ def get_variables(central_api, device_serial):
     Gets all variables for a single device based on the device serial number
     '''
     if device_serial is not None:
-        path = "/configuration/v1/devices/" + str(device_serial) +\
-               "/template_variables"
-        headers = central_api.get_headers(False, "get")
-        result = central_api.get(path=path, headers=headers)
+        path = _DEVICE_VARIABLES_PATH.format(device_serial)
+        headers = _GET_HEADERS
+        result = central_api.get(path=path, headers=headers,
+                                 cache_ttl=RESPONSE_CACHE_TTL)
         return result
     return error_msg("get_all")
 
 
+def get_variables_many(central_api, targets):
+    '''
+    Gets all variables for every device listed in targets, fetching them all
+    concurrently
+    '''
+    if targets and all(target.get('device_serial') is not None
+                       for target in targets):
+        paths = [_DEVICE_VARIABLES_PATH.format(target['device_serial'])
+                 for target in targets]
+        headers = _GET_HEADERS
+        results = central_api.get_many(paths, headers)
+        return {"resp": [result._asdict() for result in results],
+                "code": central_api.overall_code(results)}
+    return error_msg("targets")
+
+
 def get_all_variables(central_api, limit, offset):
     '''
     Gets all variables for all devices based on the limit and offset value for
     number of entries in response
     '''
-    endpoint = "/configuration/v1/devices/template_variables"
+    endpoint = _ALL_VARIABLES_PATH
     query_params = {"limit": limit, "offset": offset}
     path = central_api.get_url(endpoint, query_params)
-    headers = central_api.get_headers(False, "get")
-    result = central_api.get(path=path, headers=headers)
+    headers = _GET_HEADERS
+    result = central_api.get(path=path, headers=headers,
+                             cache_ttl=RESPONSE_CACHE_TTL)
     return result
 
 
@@ -235,25 +314,22 @@ def set_device_variables(central_api, action, device_serial, device_mac,
     and MAC address
     Performs either a create, update, or replace
     '''
-    if device_serial is not None and device_mac is not None and\
-            variables is not None:
-        path = "/configuration/v1/devices/"+str(device_serial) +\
-               "/template_variables"
-        data = {}
-        data["_sys_serial"] = device_serial
-        data["_sys_lan_mac"] = device_mac
-        for key, val in variables.items():
-            data[key] = val
-        data = {"variables": data}
-        headers = central_api.get_headers(False, "post")
-        if action.lower() == 'create':
-            result = central_api.post(path=path, headers=headers, data=data)
-        elif action.lower() == 'update':
-            result = central_api.patch(path=path, headers=headers, data=data)
-        elif action.lower() == 'replace':
-            result = central_api.put(path=path, headers=headers, data=data)
-        return result
-    return error_msg("set")
+    # variables defaults to {}, an empty definition is rejected as well
+    if device_serial is None or device_mac is None or not variables:
+        return error_msg("set")
+    path = _DEVICE_VARIABLES_PATH.format(device_serial)
+    data = {"variables": {"_sys_serial": device_serial,
+                          "_sys_lan_mac": device_mac, **variables}}
+    # Serialized here once, CentralApi sends str bodies as they are
+    data = dump_json(data)
+    headers = _POST_HEADERS
+    if action == 'create':
+        result = central_api.post(path=path, headers=headers, data=data)
+    elif action == 'update':
+        result = central_api.patch(path=path, headers=headers, data=data)
+    elif action == 'replace':
+        result = central_api.put(path=path, headers=headers, data=data)
+    return result
 
 
 def set_all_variables(central_api, action, local_file_path):
@@ -262,8 +338,8 @@ def set_all_variables(central_api, action, local_file_path):
     Performs either a create_all, update_all, or replace_all
     '''
     if local_file_path is not None:
-        path = "/configuration/v1/devices/template_variables"
-        headers = central_api.get_headers(True, "post")
+        path = _ALL_VARIABLES_PATH
+        headers = _MULTIPART_POST_HEADERS
         if action == 'create_all':
             query_params = {"format": "JSON"}
             path = central_api.get_url(path, query_params)
@@ -273,61 +349,111 @@ def set_all_variables(central_api, action, local_file_path):
             result = central_api.patch(path=path, headers=headers,
                                        filename=local_file_path)
         elif action == 'replace_all':
-            path = "/configuration/v1/devices/template_variables"
+            path = _ALL_VARIABLES_PATH
             result = central_api.put(path=path, headers=headers,
                                      filename=local_file_path)
         return result
     return error_msg("set_all")
 
 
+def set_variables_list(central_api, action, variables_list):
+    '''
+    Modifies variables for several devices in one request, by writing the
+    entries of variables_list to a temporary JSON file and uploading it
+    with the matching create_all or update_all
+    '''
+    keys = ("device_serial", "device_mac", "variables")
+    if not variables_list or any(entry.get(key) is None
+                                 for entry in variables_list for key in keys):
+        return error_msg("set_list")
+    all_variables = {}
+    for entry in variables_list:
+        data = {"_sys_serial": entry["device_serial"],
+                "_sys_lan_mac": entry["device_mac"]}
+        data.update(entry["variables"])
+        all_variables[entry["device_serial"]] = data
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".json",
+                                     delete=False) as file_obj:
+        file_obj.write(dump_json(all_variables))
+    try:
+        return set_all_variables(central_api, action + "_all", file_obj.name)
+    finally:
+        os.remove(file_obj.name)
+
+
 def delete_variables(central_api, device_serial):
     '''
     Deletes all variables for a single device
     '''
     if device_serial is not None:
-        path = "/configuration/v1/devices/" + str(device_serial) +\
-               "/template_variables"
-        headers = central_api.get_headers(False, "delete")
+        path = _DEVICE_VARIABLES_PATH.format(device_serial)
+        headers = _DELETE_HEADERS
         result = central_api.delete(path=path, headers=headers)
         return result
     return error_msg("delete")
 
 
-def api_call(module):
+# Maps each action to its handler and the playbook parameters it takes
+_ACTIONS = {
+    "get": (get_variables, ("device_serial",)),
+    "get_all": (get_all_variables, ("limit", "offset")),
+    "create": (set_device_variables, ("action", "device_serial", "device_mac",
+                                      "variables")),
+    "update": (set_device_variables, ("action", "device_serial", "device_mac",
+                                      "variables")),
+    "replace": (set_device_variables, ("action", "device_serial",
+                                       "device_mac", "variables")),
+    "create_all": (set_all_variables, ("action", "local_file_path")),
+    "update_all": (set_all_variables, ("action", "local_file_path")),
+    "replace_all": (set_all_variables, ("action", "local_file_path")),
+    "delete": (delete_variables, ("device_serial",)),
+}
+# Actions that take a list parameter in place of their single-item
+# parameters: the list parameter, and the handler and parameters used when
+# it is set. These handlers check their parameters themselves.
+_BULK_ACTIONS = {
+    "get": ("targets", get_variables_many, ("targets",)),
+    "create": ("variables_list", set_variables_list,
+               ("action", "variables_list")),
+    "update": ("variables_list", set_variables_list,
+               ("action", "variables_list")),
+}
+# Parameters each action cannot do without and the error_msg() key used
+# when one of them is missing
+_REQUIRED = {
+    "get": (("device_serial",), "get_all"),
+    "create": (("device_serial", "device_mac", "variables"), "set"),
+    "update": (("device_serial", "device_mac", "variables"), "set"),
+    "replace": (("device_serial", "device_mac", "variables"), "set"),
+    "create_all": (("local_file_path",), "set_all"),
+    "update_all": (("local_file_path",), "set_all"),
+    "replace_all": (("local_file_path",), "set_all"),
+    "delete": (("device_serial",), "delete"),
+}
+
+
+def api_call(module, action):
     '''
     Uses playbook parameters to determine type of API request to be made
     '''
-    central_api = CentralApi(module)
-    action = module.params.get('action').lower()
-    device_serial = module.params.get('device_serial')
-    device_mac = module.params.get('device_mac')
-    limit = module.params.get('limit')
-    offset = module.params.get('offset')
-    variables = module.params.get('variables')
-    local_file_path = module.params.get('local_file_path')
-
-    if action == "get":
-        result = get_variables(central_api, device_serial)
-
-    elif action == "get_all":
-        result = get_all_variables(central_api, limit, offset)
-
-    elif action == "create" or action == "update" or action == "replace":
-        result = set_device_variables(central_api, action, device_serial,
-                                      device_mac, variables)
-
-    elif action == "create_all" or action == "update_all"\
-            or action == "replace_all":
-        result = set_all_variables(central_api, action, local_file_path)
-
-    elif action == "delete":
-        result = delete_variables(central_api, device_serial)
-
+    bulk = _BULK_ACTIONS.get(action)
+    if bulk is not None and module.params[bulk[0]] is not None:
+        handler, keys = bulk[1:]
     else:
-        module.fail_json(changed=False,
-                         msg="Unsupported action provided in playbook")
+        try:
+            handler, keys = _ACTIONS[action]
+        except KeyError:
+            module.fail_json(changed=False,
+                             msg="Unsupported action provided in playbook")
 
-    return result
+        # Missing parameters are reported before any connection is set up
+        required, error_key = _REQUIRED.get(action, ((), None))
+        if any(module.params[key] is None for key in required):
+            return error_msg(error_key)
+
+    central_api = CentralApi(module)
+    params = dict(module.params, action=action)
+    return handler(central_api, **dict((key, params[key]) for key in keys))
 
 
 def main():
@@ -346,20 +472,18 @@ def main():
             limit=dict(required=False, type='int', default=20),
             offset=dict(required=False, type='int', default=0),
             variables=dict(required=False, type='dict', default={}),
-            local_file_path=dict(required=False, type='str', default=None)
+            local_file_path=dict(required=False, type='str', default=None),
+            variables_list=dict(required=False, type='list', elements='dict',
+                                default=None),
+            targets=dict(required=False, type='list', elements='dict',
+                         default=None)
             ))
 
-    success_codes = [200, 201]
+    success_codes = [200, 201, 204]
     exit_codes = [304, 400, 404]
-    changed = False
-    if "get" not in module.params.get('action').lower():
-        changed = True
-    result = api_call(module)
-
-    try:
-        result['resp'] = json.loads(result['resp'])
-    except (TypeError, ValueError):
-        pass
+    action = module.params['action'].lower()
+    changed = "get" not in action
+    result = api_call(module, action)
 
     if result['code'] and result['code'] in success_codes:
         module.exit_json(changed=changed, msg=result['resp'],
@@ -26,30 +26,170 @@ Module utility to connect with Aruba Central
 # SOFTWARE.
 
 import json
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache, partialmethod
+from types import MappingProxyType
 from ansible.module_utils.connection import Connection
-from ansible.module_utils.six.moves.urllib.parse import urlencode
+from ansible.module_utils.six.moves.urllib.parse import quote, quote_plus, \
+    urlencode
+
+try:
+    from functools import cached_property
+except ImportError:
+    # Python < 3.8
+    class cached_property(object):
+        '''
+        Computes an attribute once, then stores it on the instance so that
+        later lookups do not call the getter
+        '''
+        def __init__(self, func):
+            self.func = func
+            self.__doc__ = func.__doc__
+
+        def __get__(self, instance, owner=None):
+            if instance is None:
+                return self
+            value = instance.__dict__[self.func.__name__] = \
+                self.func(instance)
+            return value
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def dump_json(data):
+    '''
+    Encodes a request body as JSON text, using orjson when it is available.
+    The Connection RPC carries text, so orjson's bytes are decoded. Bodies
+    that are already serialized are passed on as they are.
+    '''
+    if isinstance(data, str):
+        return data
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data).decode("utf-8")
+    if HAS_ORJSON:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data)
+
+
+def load_json(raw):
+    '''
+    Decodes JSON text or bytes, using orjson when it is available
+    '''
+    if HAS_ORJSON:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def query_value(value):
+    '''
+    Returns value as it is written in a query string. str() would turn
+    booleans into "True"/"False".
+    '''
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+@lru_cache(maxsize=256)
+def _build_url(path, items):
+    '''
+    Returns path with the sorted (key, value) pairs in items appended as a
+    query string. Cached, as modules looping over devices or pages build the
+    same URLs over and over.
+    '''
+    return f"{path}?{urlencode(items, doseq=True, quote_via=quote)}"
+
+
+# Request headers by (file, method == "get"), see CentralApi.get_headers
+_JSON_HEADERS = MappingProxyType({"Content-Type": "application/json"})
+_HEADER_TABLE = {
+    (False, True): _JSON_HEADERS,
+    (False, False): _JSON_HEADERS,
+    (True, True): MappingProxyType({"Accept": "multipart/form-data"}),
+    (True, False): MappingProxyType({}),
+}
+
+# Connection objects by socket path, shared by every HttpHelper of this
+# process
+_CONNECTION_CACHE = {}
+_CONNECTION_LOCK = threading.Lock()
+
+
+class CentralResponse(namedtuple("CentralResponse", ("resp", "code"))):
+    '''
+    Result of a request: the decoded response body and the HTTP status
+    code. Fields can also be read by name, as in result['resp'], like the
+    {'resp', 'code'} dicts used for results built by the modules. Use
+    _asdict() where a result becomes part of a module's output.
+    '''
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self._fields:
+                raise KeyError(key)
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
 
 
 class HttpHelper(object):
     def __init__(self, module):
         self._module = module
-        self._connection_obj = None
 
-    @property
+    @cached_property
     def _connection(self):
-        if not self._connection_obj:
-            self._connection_obj = Connection(self._module._socket_path)
-        return self._connection_obj
+        socket_path = self._module._socket_path
+        with _CONNECTION_LOCK:
+            connection = _CONNECTION_CACHE.get(socket_path)
+            if connection is None:
+                connection = _CONNECTION_CACHE[socket_path] = \
+                    Connection(socket_path)
+        return connection
 
-    def http_request(self, path, method, data={}, headers={}, filename=None):
+    def http_request(self, path, method, data=None, headers=None,
+                     filename=None, **kwargs):
         if filename:
             return self._connection.send_file(path=path, method=method,
                                               filename=filename)
 
-        if data:
-            data = json.dumps(data)
+        if data is not None:
+            data = dump_json(data)
+        # The plugin gets its own copy, the cached headers are read-only
         return self._connection.send_request(data=data, method=method,
-                                             path=path, headers=headers)
+                                             path=path,
+                                             headers=dict(headers or {}),
+                                             **kwargs)
+
+    @staticmethod
+    def _parse(res):
+        '''
+        Decodes a response body the plugin passed on undecoded, e.g. JSON
+        sent without a JSON Content-Type. Anything that is not JSON is
+        returned unchanged.
+        '''
+        if not res or not isinstance(res, (str, bytes, bytearray)):
+            return res
+        try:
+            return load_json(res)
+        except ValueError:
+            return res
+
+    def http_files(self, requests_list):
+        return self._connection.send_files(requests_list=requests_list)
+
+    def http_requests(self, requests_list, headers=None):
+        for request in requests_list:
+            data = request.get('data')
+            if data is not None:
+                request['data'] = dump_json(data)
+        return self._connection.send_requests(requests_list=requests_list,
+                                              headers=dict(headers or {}))
 
 
 class CentralApi(HttpHelper):
@@ -58,61 +198,190 @@ class CentralApi(HttpHelper):
         self.module = module
 
     def get_url(self, path, params=None):
-        if params:
-            return path + '?' + urlencode(params)
-        else:
+        if not params:
             return path
+        items = tuple(sorted(params.items()))
+        try:
+            return _build_url(path, items)
+        except TypeError:
+            # list values (doseq) are not hashable, so skip the cache
+            return f"{path}?{urlencode(items, doseq=True, quote_via=quote)}"
 
-    def get_headers(self, file=False, method="get"):
-        if file and method == "get":
-            headers = {"Accept": "multipart/form-data"}
-        elif file and method != "get":
-            headers = {}
-        elif not file and method != "get":
-            headers = {"Content-Type": "application/json"}
-        else:
-            headers = {"Content-Type": "application/json"}
+    def build_url(self, endpoint, **params):
+        '''
+        Appends the keyword arguments to endpoint as a query string in a
+        single pass. Parameters set to None are left out, booleans are sent
+        as the JSON literals true and false the API expects.
+        '''
+        query = "&".join(f"{key}={quote_plus(query_value(value))}"
+                         for key, value in params.items()
+                         if value is not None)
+        return f"{endpoint}?{query}" if query else endpoint
 
-        return headers
+    @staticmethod
+    def get_headers(file=False, method="get"):
+        '''
+        Returns the request headers for a plain or multipart request. The
+        result is read-only, since it is shared between calls.
+        '''
+        return _HEADER_TABLE[(bool(file), method == "get")]
 
     def get_list_params(self, params_list):
-        params_str = ""
         if params_list:
-            for ele in params_list:
-                params_str = params_str+ele+","
-                if ele == params_list[-1]:
-                    params_str = params_str[:-1]
-            return params_str
-        else:
-            return params_list
-
-    def get(self, path, headers):
-        res, code = self.http_request(path=path, method="GET", headers=headers)
-        result = {'resp': res, 'code': code}
-        return result
-
-    def post(self, path, headers, data={}, filename={}):
-        res, code = self.http_request(path=path, method="POST",
-                                      headers=headers, data=data,
-                                      filename=filename)
-        result = {'resp': res, 'code': code}
-        return result
-
-    def delete(self, path, headers, data={}):
-        res, code = self.http_request(path=path, headers=headers,
-                                      method="DELETE", data=data)
-        result = {'resp': res, 'code': code}
-        return result
-
-    def patch(self, path, headers={}, data={}, filename={}):
-        res, code = self.http_request(path=path, method="PATCH",
+            return ",".join(params_list)
+        return params_list
+
+    def get_many(self, paths, headers):
+        '''
+        Issues GET requests for all paths concurrently from the httpapi
+        plugin. Returns a list of results in the same order as paths.
+        '''
+        responses = self.http_requests(
+            [{'path': path, 'method': "GET"} for path in paths], headers)
+        return [CentralResponse(self._parse(res), code)
+                for res, code in responses]
+
+    def send_many(self, method, path, headers, data_list):
+        '''
+        Issues one request to path per entry of data_list concurrently from
+        the httpapi plugin. Returns a list of results in the same order.
+        '''
+        responses = self.http_requests(
+            [{'path': path, 'method': method, 'data': data}
+             for data in data_list], headers)
+        return [CentralResponse(self._parse(res), code)
+                for res, code in responses]
+
+    def post_many(self, path, headers, data_list):
+        return self.send_many("POST", path, headers, data_list)
+
+    def delete_many(self, path, headers, data_list):
+        return self.send_many("DELETE", path, headers, data_list)
+
+    def bulk_post(self, path, headers, items, chunk_size=100):
+        '''
+        POSTs items to a bulk endpoint of Central that takes a JSON array,
+        chunk_size items per request. The chunks are sent concurrently from
+        the httpapi plugin. Returns a list of results, one per chunk, which
+        merge_results() can combine. chunk_size has to be positive.
+        '''
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be a positive number of items,"
+                             " got {}".format(chunk_size))
+        return self.send_many("POST", path, headers,
+                              [items[start:start + chunk_size]
+                               for start in range(0, len(items),
+                                                  chunk_size)])
+
+    def send_batches(self, requests_list, headers, batch_size,
+                     batch_delay=0):
+        '''
+        Sends requests_list (dicts with "path", "method" and optionally
+        "data") in batches of batch_size concurrent requests, pausing
+        batch_delay seconds between batches so that bulk changes do not
+        overwhelm the API gateway. Returns the result of every request in
+        order, followed by the overall result code: the first failure, or
+        200 if all of them succeeded.
+        '''
+        results = []
+        for start in range(0, len(requests_list), batch_size):
+            if start and batch_delay:
+                time.sleep(batch_delay)
+            responses = self.http_requests(
+                requests_list[start:start + batch_size], headers)
+            results.extend(CentralResponse(self._parse(res), code)
+                           for res, code in responses)
+        return results, self.overall_code(results)
+
+    def send_file_batches(self, requests_list, batch_size, batch_delay=0):
+        '''
+        Uploads files for requests_list (dicts with "path", "method" and
+        "filename") like send_batches(), batch_size at a time with a pause
+        of batch_delay seconds between batches
+        '''
+        results = []
+        for start in range(0, len(requests_list), batch_size):
+            if start and batch_delay:
+                time.sleep(batch_delay)
+            responses = self.http_files(
+                requests_list[start:start + batch_size])
+            results.extend(CentralResponse(self._parse(res), code)
+                           for res, code in responses)
+        return results, self.overall_code(results)
+
+    @staticmethod
+    def overall_code(results):
+        '''
+        Returns the code of the first unsuccessful result, or 200 if all of
+        them succeeded
+        '''
+        for result in results:
+            if result['code'] not in (200, 201, 204):
+                return result['code']
+        return 200
+
+    def merge_results(self, results):
+        '''
+        Combines the results of a request split into several batches into a
+        single result. Lists in the responses are concatenated, objects are
+        merged and counts are added up. The first unsuccessful result is
+        returned as is.
+        '''
+        for result in results:
+            if result['code'] not in (200, 201, 204):
+                return result
+        if len(results) == 1:
+            return results[0]
+        merged = None
+        for result in results:
+            resp = result['resp']
+            if not isinstance(resp, dict) or not isinstance(merged, dict):
+                merged = resp if merged is None else merged
+                continue
+            for key, value in resp.items():
+                current = merged.get(key)
+                if isinstance(current, list) and isinstance(value, list):
+                    current.extend(value)
+                elif isinstance(current, dict) and isinstance(value, dict):
+                    current.update(value)
+                elif isinstance(current, int) and isinstance(value, int) \
+                        and not isinstance(value, bool):
+                    merged[key] = current + value
+                elif key not in merged:
+                    merged[key] = value
+        return CentralResponse(merged, results[0]['code'])
+
+    def _call(self, method, path, headers=None, data=None, filename=None,
+              **kwargs):
+        '''
+        Sends a single request and returns its result as a CentralResponse.
+        Keyword arguments left as None (e.g. get()'s cache_ttl) are
+        not passed on to the plugin.
+        '''
+        kwargs = {key: val for key, val in kwargs.items() if val is not None}
+        res, code = self.http_request(path=path, method=method,
                                       headers=headers, data=data,
-                                      filename=filename)
-        result = {'resp': res, 'code': code}
-        return result
-
-    def put(self, path, headers={}, data={}, filename={}):
-        res, code = self.http_request(path=path, method="PUT", headers=headers,
-                                      data=data, filename=filename)
-        result = {'resp': res, 'code': code}
-        return result
+                                      filename=filename, **kwargs)
+        return CentralResponse(self._parse(res), code)
+
+    def get(self, path, headers=None, stream_items_path=None,
+            cache_ttl=None):
+        '''
+        Sends a GET request. stream_items_path and cache_ttl let the plugin
+        parse only part of the response or answer from a response cached
+        less than cache_ttl seconds ago. Written out rather than going
+        through _call, as it is by far the most frequent request and never
+        has a body or file.
+        '''
+        kwargs = {}
+        if stream_items_path is not None:
+            kwargs['stream_items_path'] = stream_items_path
+        if cache_ttl is not None:
+            kwargs['cache_ttl'] = cache_ttl
+        res, code = self.http_request(path, "GET", headers=headers, **kwargs)
+        return CentralResponse(self._parse(res), code)
+
+    post = partialmethod(_call, "POST")
+    delete = partialmethod(_call, "DELETE")
+    patch = partialmethod(_call, "PATCH")
+    put = partialmethod(_call, "PUT")
@@ -0,0 +1,81 @@
+'''
+Shared fixtures for the unit tests. The role is not an installable package,
+so its plugins and module utilities are loaded straight from their files.
+'''
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("ansible")
+pytest.importorskip("requests")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_source(name, relative_path):
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(ROOT, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def central_http():
+    # Registered where the modules and the httpapi plugin import it from
+    import ansible.module_utils  # NOQA
+    return load_source("ansible.module_utils.central_http",
+                       "module_utils/central_http.py")
+
+
+@pytest.fixture(scope="session")
+def httpapi(central_http):
+    return load_source("aruba_central_httpapi",
+                       "httpapi_plugins/aruba_central.py")
+
+
+@pytest.fixture(scope="session")
+def inventory_plugin():
+    return load_source("central_inventory",
+                       "inventory_plugins/central_inventory.py")
+
+
+class FakeConnection(object):
+    '''
+    Stands in for the Connection RPC to the httpapi plugin, recording the
+    calls made and answering each with reply
+    '''
+    def __init__(self, reply=(None, 200)):
+        self.reply = reply
+        self.calls = []
+
+    def send_request(self, **kwargs):
+        self.calls.append(("send_request", kwargs))
+        return self.reply
+
+    def send_requests(self, **kwargs):
+        self.calls.append(("send_requests", kwargs))
+        return [self.reply] * len(kwargs["requests_list"])
+
+
+class FakeModule(object):
+    _socket_path = "/tmp/fake-central-socket"
+
+
+@pytest.fixture
+def connection(central_http, monkeypatch):
+    fake = FakeConnection()
+    monkeypatch.setattr(central_http, "_CONNECTION_CACHE", {},
+                        raising=False)
+    monkeypatch.setattr(central_http, "Connection",
+                        lambda socket_path: fake)
+    return fake
+
+
+@pytest.fixture
+def central_api(central_http, connection):
+    return central_http.CentralApi(FakeModule())
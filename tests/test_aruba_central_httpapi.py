@@ -0,0 +1,192 @@
+'''
+Unit tests for httpapi_plugins/aruba_central.py
+'''
+
+import io
+import json
+import os
+import time
+
+import pytest
+
+
+class FakePluginConnection(object):
+    '''
+    Stands in for the persistent connection the httpapi plugin is attached
+    to
+    '''
+    def __init__(self, **options):
+        self.options = dict(host="apigw.example.com", use_ssl=True,
+                            validate_certs=True,
+                            persistent_command_timeout=30)
+        self.options.update(options)
+
+    def get_option(self, name):
+        return self.options.get(name)
+
+
+@pytest.fixture
+def make_plugin(httpapi):
+    def make(**options):
+        plugin = httpapi.HttpApi(FakePluginConnection())
+        plugin.get_option = options.get
+        plugin.valid_token = lambda: None
+        plugin.set_access_token("token")
+        return plugin
+    return make
+
+
+def fill_caches(httpapi, plugin):
+    plugin._response_cache[("token", "/groups")] = (
+        time.monotonic() + 60, ({"data": []}, 200), None)
+    cache_file = plugin.etag_cache_file("/groups", {}, None)
+    httpapi.write_etag_cache(cache_file, '"abc"', ({"data": []}, 200), 60)
+    assert os.path.exists(cache_file)
+    return cache_file
+
+
+@pytest.fixture
+def async_batches(httpapi, monkeypatch):
+    '''
+    Sends batches down the aiohttp path without any network access
+    '''
+    sent = []
+
+    async def send_requests_async(self, requests_list, headers):
+        sent.extend(requests_list)
+        return [(None, 204)] * len(requests_list)
+
+    monkeypatch.setattr(httpapi, "HAS_AIOHTTP", True)
+    monkeypatch.setattr(httpapi.HttpApi, "send_requests_async",
+                        send_requests_async)
+    return sent
+
+
+def test_batch_write_invalidates_caches(httpapi, make_plugin, tmp_path,
+                                        async_batches):
+    plugin = make_plugin(etag_cache_dir=str(tmp_path))
+    cache_file = fill_caches(httpapi, plugin)
+    results = plugin.send_requests(
+        [{"path": "/configuration/v2/groups/a", "method": "DELETE"}], {})
+    assert results == [(None, 204)]
+    assert async_batches
+    assert not plugin._response_cache
+    assert not os.path.exists(cache_file)
+
+
+def test_batch_read_keeps_caches(httpapi, make_plugin, tmp_path,
+                                 async_batches):
+    plugin = make_plugin(etag_cache_dir=str(tmp_path))
+    cache_file = fill_caches(httpapi, plugin)
+    plugin.send_requests([{"path": "/central/v2/sites", "method": "GET"}],
+                         {})
+    assert plugin._response_cache
+    assert os.path.exists(cache_file)
+
+
+class FakeResponse(object):
+    def __init__(self, path):
+        self.status_code = 200
+        self.headers = {"Content-Type": "application/json",
+                        "ETag": '"{}"'.format(path)}
+        self.content = json.dumps({"path": path}).encode()
+
+
+def test_threaded_batch_keeps_the_cache_bounded(httpapi, make_plugin,
+                                                monkeypatch):
+    monkeypatch.setattr(httpapi, "HAS_AIOHTTP", False)
+    monkeypatch.setattr(httpapi, "RESPONSE_CACHE_SIZE", 4)
+    plugin = make_plugin()
+
+    def request(method, url, **kwargs):
+        time.sleep(0.001)
+        return FakeResponse(url.rsplit("/", 1)[-1])
+    monkeypatch.setattr(plugin._session, "request", request)
+    requests_list = [{"path": "/sites/{}".format(number), "method": "GET"}
+                     for number in range(64)]
+    results = plugin.send_requests(requests_list, {})
+    assert results == [({"path": str(number)}, 200)
+                       for number in range(64)]
+    assert len(plugin._response_cache) == 4
+
+
+def test_disk_cache_is_kept_per_account(make_plugin, tmp_path):
+    first = make_plugin(etag_cache_dir=str(tmp_path), client_id="one")
+    second = make_plugin(etag_cache_dir=str(tmp_path), client_id="two")
+    assert first.etag_cache_file("/groups", {}, None) != \
+        second.etag_cache_file("/groups", {}, None)
+    assert make_plugin().etag_cache_file("/groups", {}, None) is None
+
+
+def test_etag_cache_round_trip(httpapi, tmp_path):
+    cache_file = str(tmp_path / "account" / "entry.json")
+    httpapi.write_etag_cache(cache_file, '"v1"', ({"total": 1}, 200), 30)
+    expires, result, etag = httpapi.read_etag_cache(cache_file)
+    assert result == ({"total": 1}, 200)
+    assert etag == '"v1"'
+    assert expires > time.monotonic()
+    # Without a lifetime the entry is only good for revalidation
+    httpapi.write_etag_cache(cache_file, '"v2"', ({"total": 2}, 200))
+    assert httpapi.read_etag_cache(cache_file)[0] == 0
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({}, None),
+    ({"Cache-Control": "private, max-age=120"}, 120),
+    ({"Cache-Control": "no-cache"}, 0),
+    ({"Cache-Control": "max-age=oops"}, 0),
+    ({"Expires": "0"}, 0),
+    ({"Date": "Mon, 01 Jan 2024 00:00:00 GMT",
+      "Expires": "Mon, 01 Jan 2024 00:01:00 GMT"}, 60),
+])
+def test_freshness_lifetime(httpapi, headers, expected):
+    assert httpapi.freshness_lifetime(headers) == expected
+
+
+def test_multipart_body_is_sized_and_replayable(httpapi, tmp_path):
+    upload = tmp_path / "template.txt"
+    upload.write_bytes(b"hostname %_sys_hostname%\n" * 1000)
+    with open(str(upload), "rb") as file_obj:
+        body = httpapi.MultipartBody("template", str(upload), file_obj,
+                                     "boundary", "text/plain")
+        first = b"".join(iter(lambda: body.read(8192), b""))
+        assert len(first) == len(body)
+        # What a retry does before sending the body again
+        body.seek(0)
+        assert body.read() == first
+    assert first.startswith(b'--boundary\r\nContent-Disposition: form-data;'
+                            b' name="template"; filename="template.txt"')
+    assert first.endswith(b"\r\n--boundary--\r\n")
+    assert upload.read_bytes() in first
+
+
+SITES_BODY = json.dumps({
+    "count": 2, "total": 5, "sites": [{"site_id": 1, "tags": ["a", "b"]},
+                                      {"site_id": 2, "tags": []}],
+    "links": {"next": "/central/v2/sites?offset=2"}}).encode()
+SITES = {"count": 2, "total": 5, "sites": [{"site_id": 1, "tags": ["a", "b"]},
+                                           {"site_id": 2, "tags": []}]}
+
+
+def test_load_items_keeps_response_shape(httpapi, monkeypatch):
+    monkeypatch.setattr(httpapi, "HAS_IJSON", False)
+    assert httpapi.load_items(io.BytesIO(SITES_BODY), "sites.item") == SITES
+
+
+def test_load_items_with_ijson(httpapi, monkeypatch):
+    ijson = pytest.importorskip("ijson")
+    monkeypatch.setattr(httpapi, "HAS_IJSON", True)
+    monkeypatch.setattr(httpapi, "ijson", ijson, raising=False)
+    assert httpapi.load_items(io.BytesIO(SITES_BODY), "sites.item") == SITES
+    groups = b'{"data": [["default"], ["branch"]], "total": 2}'
+    assert httpapi.load_items(io.BytesIO(groups), "data.item") == \
+        {"data": [["default"], ["branch"]], "total": 2}
+
+
+def test_retry_delay(httpapi):
+    assert httpapi.retry_delay("POST", 503, {}, 0) is None
+    assert httpapi.retry_delay("POST", 429, {"Retry-After": "2"}, 0) == 2
+    assert httpapi.retry_delay("GET", 503, {}, 1) == \
+        httpapi.RETRY_POLICY["backoff_factor"] * 2
+    assert httpapi.retry_delay("GET", 503, {},
+                               httpapi.RETRY_POLICY["total"]) is None
@@ -0,0 +1,139 @@
+'''
+Unit tests for module_utils/central_http.py
+'''
+
+import pytest
+
+
+def test_get_url_sorts_and_quotes_params(central_api):
+    path = central_api.get_url("/central/v2/sites",
+                               {"sort": "+site_name", "limit": 20,
+                                "groups": "a b,c"})
+    assert path == ("/central/v2/sites?groups=a%20b%2Cc&limit=20"
+                    "&sort=%2Bsite_name")
+    # Same URL whatever the order of the params
+    assert central_api.get_url(
+        "/central/v2/sites", {"groups": "a b,c", "sort": "+site_name",
+                              "limit": 20}) == path
+
+
+def test_get_url_without_params(central_api):
+    assert central_api.get_url("/configuration/v2/groups") == \
+        "/configuration/v2/groups"
+    assert central_api.get_url("/configuration/v2/groups", {}) == \
+        "/configuration/v2/groups"
+
+
+def test_get_url_with_list_values(central_api):
+    # Lists cannot be cached, they are encoded one value at a time
+    assert central_api.get_url("/x", {"id": ["1", "2"]}) == "/x?id=1&id=2"
+
+
+def test_build_url_encodes_booleans_and_skips_none(central_api):
+    path = central_api.build_url("/configuration/v1/templates",
+                                 all_groups=True, details=False,
+                                 device_type="IAP", model=None,
+                                 exclude_groups="a b")
+    assert path == ("/configuration/v1/templates?all_groups=true"
+                    "&details=false&device_type=IAP&exclude_groups=a+b")
+
+
+def test_build_url_without_params(central_api):
+    assert central_api.build_url("/x", limit=None) == "/x"
+
+
+@pytest.mark.parametrize("codes, expected", [
+    ([200, 201, 204], 200),
+    ([200, 404, 500], 404),
+    ([], 200),
+])
+def test_overall_code(central_api, codes, expected):
+    results = [{"resp": None, "code": code} for code in codes]
+    assert central_api.overall_code(results) == expected
+
+
+def test_merge_results_combines_pages(central_api):
+    results = [
+        {"resp": {"data": [["a"]], "total": 3, "meta": {"x": 1}},
+         "code": 200},
+        {"resp": {"data": [["b"], ["c"]], "total": 3, "meta": {"y": 2}},
+         "code": 200},
+    ]
+    merged = central_api.merge_results(results)
+    assert merged["code"] == 200
+    assert merged["resp"] == {"data": [["a"], ["b"], ["c"]], "total": 6,
+                              "meta": {"x": 1, "y": 2}}
+
+
+def test_merge_results_returns_first_failure(central_api):
+    failure = {"resp": "Not found", "code": 404}
+    results = [{"resp": {"data": []}, "code": 200}, failure]
+    assert central_api.merge_results(results) is failure
+
+
+def test_merge_results_single_result(central_api):
+    result = {"resp": {"data": [1]}, "code": 200}
+    assert central_api.merge_results([result]) is result
+
+
+def test_central_response_reads_like_a_dict(central_http):
+    result = central_http.CentralResponse({"a": 1}, 201)
+    assert result["resp"] == {"a": 1}
+    assert result["code"] == result.code == result[1] == 201
+    assert result._asdict() == {"resp": {"a": 1}, "code": 201}
+    with pytest.raises(KeyError):
+        result["status"]
+
+
+def test_merge_results_returns_central_response(central_api, central_http):
+    results = [central_http.CentralResponse({"data": [1], "total": 1}, 200),
+               central_http.CentralResponse({"data": [2], "total": 1}, 200)]
+    merged = central_api.merge_results(results)
+    assert isinstance(merged, central_http.CentralResponse)
+    assert merged == ({"data": [1, 2], "total": 2}, 200)
+
+
+def test_get_passes_only_given_options(central_api, connection):
+    connection.reply = ('{"total": 0}', 200)
+    result = central_api.get("/configuration/v2/groups", cache_ttl=60)
+    assert result["resp"] == {"total": 0}
+    assert result["code"] == 200
+    name, kwargs = connection.calls[-1]
+    assert name == "send_request"
+    assert kwargs == {"data": None, "method": "GET",
+                      "path": "/configuration/v2/groups", "headers": {},
+                      "cache_ttl": 60}
+
+
+def test_post_serializes_body_once(central_api, connection):
+    central_api.post("/central/v2/sites", data={"site_name": "a"})
+    central_api.post("/central/v2/sites", data='{"site_name": "b"}')
+    central_api.post("/central/v2/sites", data=b'{"site_name": "c"}')
+    central_api.post("/central/v2/sites", data={})
+    bodies = [kwargs["data"] for name, kwargs in connection.calls]
+    assert [body.replace(" ", "") for body in bodies] == [
+        '{"site_name":"a"}', '{"site_name":"b"}', '{"site_name":"c"}', "{}"]
+
+
+def test_non_json_body_is_returned_unchanged(central_api, connection):
+    connection.reply = ("hostname %_sys_hostname%", 200)
+    result = central_api.get("/configuration/v1/groups/g/templates/t")
+    assert result["resp"] == "hostname %_sys_hostname%"
+
+
+def test_bulk_post_chunks_items(central_api, connection):
+    results = central_api.bulk_post("/bulk", {}, list(range(5)),
+                                    chunk_size=2)
+    name, kwargs = connection.calls[-1]
+    assert name == "send_requests"
+    assert [request["data"].replace(" ", "")
+            for request in kwargs["requests_list"]] == \
+        ["[0,1]", "[2,3]", "[4]"]
+    assert len(results) == 3
+
+
+@pytest.mark.parametrize("chunk_size", [0, -1])
+def test_bulk_post_rejects_empty_chunks(central_api, connection, chunk_size):
+    with pytest.raises(ValueError):
+        central_api.bulk_post("/bulk", {}, [1, 2], chunk_size=chunk_size)
+    assert not connection.calls
@@ -0,0 +1,161 @@
+'''
+Unit tests for inventory_plugins/central_inventory.py
+'''
+
+import os
+import stat
+import sys
+import threading
+import time
+
+import pytest
+import yaml
+
+
+class YamlStr(str):
+    '''
+    str subclass standing in for the AnsibleUnicode (or tagged) strings that
+    Ansible's YAML loader returns, which SafeDumper cannot represent
+    '''
+
+
+class FakeInventory(object):
+    def __init__(self):
+        self.hosts = {}
+
+    def add_host(self, host):
+        self.hosts.setdefault(host, {})
+
+    def set_variable(self, host, name, value):
+        self.hosts[host][name] = value
+
+
+@pytest.fixture
+def plugin(inventory_plugin, tmp_path):
+    instance = inventory_plugin.InventoryModule()
+    instance.inventory = FakeInventory()
+    instance.inventory_file = str(tmp_path / "central_inventory.yml")
+    instance.inv_data = {YamlStr("plugin"): YamlStr("central_inventory"),
+                         YamlStr("host"): YamlStr("central"),
+                         YamlStr("api_gateway"): YamlStr("apigw.example"),
+                         YamlStr("access_token"): YamlStr("old-access"),
+                         YamlStr("refresh_token"): YamlStr("old-refresh"),
+                         YamlStr("client_id"): YamlStr("id"),
+                         YamlStr("client_secret"): YamlStr("secret"),
+                         YamlStr("cache_bootstrap"): True}
+    with open(instance.inventory_file, "w") as inv:
+        inv.write("plugin: central_inventory\n")
+    instance.host = "central"
+    instance.api_gw = "apigw.example"
+    instance.acc_tok = "old-access"
+    instance.ref_tok = "old-refresh"
+    instance.client_id = "id"
+    instance.client_sec = "secret"
+    return instance
+
+
+@pytest.fixture
+def cached_tokens(inventory_plugin, monkeypatch):
+    '''
+    Keeps the token cache in memory only, returning what was cached
+    '''
+    cached = {}
+    monkeypatch.setattr(inventory_plugin, "cache_token",
+                        lambda acc_tok, ttl: cached.__setitem__(acc_tok, ttl))
+    return cached
+
+
+def test_plain_data(inventory_plugin):
+    data = inventory_plugin.plain_data(
+        {YamlStr("a"): [YamlStr("b"), 1, True, None], "c": {"d": 1.5}})
+    assert data == {"a": ["b", 1, True, None], "c": {"d": 1.5}}
+    assert type(list(data)[0]) is str
+    assert type(data["a"][0]) is str
+
+
+def test_save_tokens_writes_plain_yaml(plugin):
+    plugin.save_tokens(YamlStr("new-access"), YamlStr("new-refresh"))
+    with open(plugin.inventory_file) as inv:
+        saved = yaml.safe_load(inv)
+    assert saved["access_token"] == "new-access"
+    assert saved["refresh_token"] == "new-refresh"
+    assert saved["cache_bootstrap"] is True
+    assert abs(saved["token_issued_at"] - time.time()) < 60
+
+
+def test_write_inventory_keeps_secrets_private(plugin, inventory_plugin,
+                                               monkeypatch):
+    os.chmod(plugin.inventory_file, 0o640)
+    modes = []
+    copymode = inventory_plugin.shutil.copymode
+
+    def record_copymode(src, dst):
+        # The secrets are already written when the config's mode is copied
+        modes.append(stat.S_IMODE(os.stat(dst).st_mode))
+        copymode(src, dst)
+    monkeypatch.setattr(inventory_plugin.shutil, "copymode", record_copymode)
+    plugin.write_inventory({"access_token": "secret"})
+    assert modes == [0o600]
+    assert stat.S_IMODE(os.stat(plugin.inventory_file).st_mode) == 0o640
+    assert os.listdir(os.path.dirname(plugin.inventory_file)) == \
+        ["central_inventory.yml"]
+
+
+def test_bootstrap_does_not_renew_a_fresh_token(plugin, inventory_plugin,
+                                                monkeypatch, cached_tokens):
+    plugin.cache_bootstrap = True
+    monkeypatch.setattr(inventory_plugin, "token_expiry",
+                        lambda acc_tok: time.time() + 3600)
+    monkeypatch.setattr(inventory_plugin, "validate_token",
+                        lambda *args: (True, [["default"]]))
+
+    def token_renew(*args):
+        raise AssertionError("a fresh token must not be renewed")
+    monkeypatch.setattr(inventory_plugin, "token_renew", token_renew)
+    plugin.populate()
+    host = plugin.inventory.hosts["central"]
+    assert host["ansible_httpapi_central_access_token"] == "old-access"
+    assert host["central_groups_cache"] == [["default"]]
+
+
+def test_validated_token_is_not_trusted_past_its_expiry(plugin,
+                                                        inventory_plugin,
+                                                        monkeypatch,
+                                                        cached_tokens):
+    plugin.cache_bootstrap = True
+    plugin.ref_tok = None
+    monkeypatch.setattr(inventory_plugin, "token_expiry",
+                        lambda acc_tok: time.time() + 600)
+    monkeypatch.setattr(inventory_plugin, "validate_token",
+                        lambda *args: (True, None))
+    plugin.populate()
+    assert 0 < cached_tokens["old-access"] <= 600
+
+
+def test_http2_falls_back_to_requests_without_httpx(inventory_plugin,
+                                                   monkeypatch):
+    # A None entry makes "import httpx" raise ImportError
+    monkeypatch.setitem(sys.modules, "httpx", None)
+    monkeypatch.setattr(inventory_plugin, "_HTTP2_CLIENT", None)
+    monkeypatch.setattr(inventory_plugin, "_SESSION", None)
+    session = inventory_plugin._get_session(http2=True)
+    assert inventory_plugin._HTTP2_CLIENT is False
+    assert session is inventory_plugin._SESSION is not None
+    assert "httpx" not in vars(inventory_plugin)
+
+
+def test_failed_background_renewal_is_reported(plugin, inventory_plugin,
+                                               monkeypatch):
+    warnings = []
+    monkeypatch.setattr(inventory_plugin.display, "warning", warnings.append)
+
+    def token_renew(*args):
+        raise ValueError("gateway unreachable")
+    monkeypatch.setattr(inventory_plugin, "token_renew", token_renew)
+    plugin.use_http2 = False
+    plugin.renew_in_background()
+    for thread in threading.enumerate():
+        if thread.name == "central_token_renew":
+            thread.join()
+    assert len(warnings) == 1
+    assert "gateway unreachable" in warnings[0]